@@ -18,10 +18,14 @@ import pathlib
 import shutil
 import platform
 import configparser
+import re
 
 #阿里账户信息
 DASHSCOPE_API_KEY = ""  # 从config.ini读取（如需使用阿里云服务）
 
+# 当前平台（启动时查询一次）
+SYSTEM = platform.system()
+
 # 获取项目内缓存路径
 current_dir = pathlib.Path(__file__).parent.parent
 print(f"使用项目内缓存目录：{current_dir}")
@@ -66,7 +70,8 @@ os.environ["PATH"] = str(FFMPEG_BIN_DIR) + os.pathsep + os.environ["PATH"]
 try:
     import subprocess
 
-    subprocess.run(["ffmpeg", "-version"], check=True, capture_output=True, text=True)
+    # 只看返回码，版本信息直接丢弃，不再捕获并解码
+    subprocess.run(["ffmpeg", "-version"], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
     print("✅ FFmpeg 找到并可用")
 except Exception as e:
     print("❌ FFmpeg 未找到或不可用:", e)
@@ -105,6 +110,10 @@ tasks: Dict[str, Dict] = {}
 task_lock = threading.Lock()
 # 任务过期时间：完成后30分钟清理（避免内存占用）
 TASK_EXPIRE_MINUTES = 30
+# 进度行匹配（预编译，兼容行首空白、"PROGRESS:  50%"、小数进度）
+PROGRESS_RE = re.compile(r"\s*PROGRESS:\s*([-+]?\d+(?:\.\d+)?)")
+# 子进程输出管道的读取缓冲上限（1MB）：缓冲超过2倍上限才暂停读取，减少暂停/恢复和系统调用次数，长行也不会触发LimitOverrunError
+SUBPROCESS_STREAM_LIMIT = 1 << 20
 
 
 # -------------------------- 配置文件读取 --------------------------
@@ -284,28 +293,13 @@ def parse_script_output(line: str, task_info: Dict):
     # 避免strip()导致原始格式丢失，影响后续其他信息解析
     task_info["output"] += line + "\n"
 
-    # 2. 处理行首空白（仅去除左侧空白，保留右侧和中间的格式）
-    # 应对：行首有空格、换行符、制表符等情况
-    processed_line = line.lstrip()  # 只去掉左侧空白，右侧空白不影响判断
-
-    # 3. 解析进度（约定脚本输出PROGRESS:XX%格式的行表示进度）
-    if processed_line.startswith("PROGRESS:"):
-        try:
-            # 分割后处理可能的空格（如"PROGRESS:  50%"）
-            progress_part = processed_line.split(":", 1)[1].strip()
-            progress_str = progress_part.rstrip("%").strip()
-            # 去除百分号并转换为整数（兼容"50%"或"50"的情况）
-            # 支持小数
-            progress_float = float(progress_str)
-
-            # 四舍五入成整数百分比（如果需要保留小数，可以直接存 float）
-            progress = round(progress_float)
-
-            # 确保进度在 0-100 之间
-            task_info["progress"] = max(0, min(100, progress))
-        except (ValueError, IndexError):
-            # 格式错误时忽略，不影响其他输出解析
-            pass
+    # 2. 解析进度（约定脚本输出PROGRESS:XX%格式的行表示进度）
+    # 预编译正则一次匹配完成：跳过行首空白、提取数值（兼容"50%"/"50"/小数），不再逐步切分字符串
+    match = PROGRESS_RE.match(line)
+    if match:
+        # 四舍五入成整数百分比，并确保进度在 0-100 之间
+        progress = round(float(match.group(1)))
+        task_info["progress"] = max(0, min(100, progress))
 
 
 async def run_script_async(task_id: str, script_path: str, script_args: List[str]):
@@ -358,6 +352,7 @@ async def run_script_async(task_id: str, script_path: str, script_args: List[str
             stdout=asyncio.subprocess.PIPE,  # 字节流输出
             stderr=asyncio.subprocess.PIPE,
             env=sub_env,
+            limit=SUBPROCESS_STREAM_LIMIT,
             # 移除 text=True，默认 text=False（字节模式）
             # 不指定 encoding，避免冲突
         )
@@ -567,9 +562,9 @@ async def open_folder(req: OpenFolderRequest):  # 关键：用模型接收请求
 
     # 4. 跨平台打开文件夹（原有逻辑保留，优化错误信息）
     try:
-        if platform.system() == "Windows":
+        if SYSTEM == "Windows":
             os.startfile(folder_path)  # Windows专用
-        elif platform.system() == "Darwin":
+        elif SYSTEM == "Darwin":
             subprocess.run(
                 ["open", folder_path], check=True, capture_output=True
             )  # Mac
@@ -615,7 +610,7 @@ if __name__ == "__main__":
     load_config_from_ini()
     # -------------------------- 修改：统一事件循环类型 --------------------------
     loop = None
-    if platform.system() == "Windows":
+    if SYSTEM == "Windows":
         # Windows 推荐使用 ProactorEventLoop（适配子进程管道处理）
         loop = asyncio.ProactorEventLoop()
         print("✅ Windows 平台：使用 ProactorEventLoop")
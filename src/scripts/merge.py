@@ -193,7 +193,7 @@ def merge_speaker_audio(file_path, target_dir, preserve_timeline):
     # 步骤1：收集片段信息（基于转码WAV和JSON）
     print(f"\n=== 步骤1/4：收集片段信息 ===")
     all_segments = collect_all_segments(target_dir, ext_with_dot)
-    audio_list_sorted = sorted(all_segments, key=lambda x: x[1])  # 根据开始时间排序
+    audio_list_sorted = all_segments  # collect_all_segments 已按开始时间排序
 
     # 步骤2：准备合并参数（用转码WAV参数替代原始文件）
     print(f"\n=== 步骤2/4：准备合并参数 ===")
@@ -8,6 +8,7 @@ import subprocess
 import sys
 import time
 import shutil 
+import tempfile
 
 
 current_script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -23,7 +24,10 @@ from util import (
     get_audio_duration, 
     convert_to_wav,
     load_wav,
-    extract_media_segment,
+    extract_media_segments,
+    group_segment_jobs,
+    get_media_duration,
+    CPU_COUNT,
     stitch_segments_with_empty_timeline,
     
 )
@@ -54,6 +58,12 @@ SPEAKER_TYPES = {
 # 新增：并发转录配置（IO密集型，建议4-8线程，避免服务器过载）
 TRANSCRIBE_THREADS = 8  # 默认线程数
 MAX_TRANSCRIBE_THREADS = 8  # 最大线程数限制
+# 新增：并发提取片段配置（每个片段独立ffmpeg子进程，线程只负责等待）
+EXTRACT_THREADS = max(1, min(8, CPU_COUNT))
+# 同时拼接的说话人数：前一个说话人收尾（拼接/清理）时下一个已开始转码，编码进程总数仍由util统一限流
+STITCH_WORKERS = 2
+# 并发拼接时每个最终编码可用的线程数（避免每个ffmpeg都按整机核数开线程而超额订阅）
+STITCH_ENCODE_THREADS = max(1, CPU_COUNT // STITCH_WORKERS)
 EXTRACT_AUDIO_BY_ROLE = True  # 按说话人提取音频片段
 PRESERVE_TIMELINE = False  # 提取音频片段保留时间线
 
@@ -198,13 +208,21 @@ def transcribe_with_qwen_asr(task_id, segment_audio_path, tmp_dir):
 
     try:
         # 5. 执行子进程（移除Windows不兼容的环境变量，避免编码干扰）
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            encoding="utf-8",  # Windows下用utf-8确保参数解析无乱码
-            check=True,
-        )
+        # 结果从txt文件读取，stdout直接丢弃；stderr写入临时文件，只有失败时才读回并解码
+        with tempfile.TemporaryFile() as err_file:
+            result = subprocess.run(
+                cmd,
+                stdout=subprocess.DEVNULL,
+                stderr=err_file,
+                stdin=subprocess.DEVNULL,
+            )
+            if result.returncode != 0:
+                err_file.seek(0)
+                raise subprocess.CalledProcessError(
+                    result.returncode,
+                    cmd,
+                    stderr=err_file.read().decode("utf-8", errors="ignore"),  # Windows下用utf-8确保无乱码
+                )
         print(f"片段{task_id}：子进程执行成功 → {result.returncode}")
 
         # 6. 读取转录结果（和原逻辑一致）
@@ -259,53 +277,50 @@ def get_single_and_mix_segments(speaker_diarization, min_duration):
             (turn.start, turn.end, spk)
         )  # 存储所有turn（开始、结束、说话人）
 
-    # 步骤1：生成所有事件点（开始/结束），用于扫描重叠
+    # 步骤1：生成所有事件点（开始/结束，附带说话人），用于扫描重叠
     events = []
-    for s, e, _ in all_turns:
-        events.append((s, "start"))  # 开始事件
-        events.append((e, "end"))  # 结束事件
+    for s, e, spk in all_turns:
+        events.append((s, "start", spk))  # 开始事件
+        events.append((e, "end", spk))  # 结束事件
     # 排序：先按时间，结束事件优先于同时刻的开始事件（避免重复计算）
     events.sort(key=lambda x: (x[0], 0 if x[1] == "end" else 1))
 
-    # 步骤2：扫描事件点，统计每个时间段的说话人数量
-    time_segments = []  # 存储 (时间段开始, 时间段结束, 该时间段内说话人数量)
+    # 步骤2+3：一次扫描事件点，边扫描边维护当前活跃的说话人，直接得到每个时间段的说话人集合
+    # （时间段边界都是事件点，活跃turn必然覆盖整个时间段，无需再对每个时间段遍历全部turn，O(N²)→O(N log N)）
+    # 合并相邻（首尾相接，误差EPSILON以内）且说话人相同的时间段（减少后续提取片段数）
+    labeled_segs = []  # 格式：[start, end, speaker_set]
+    active_counts = {}  # 说话人 → 当前未结束的turn数（同一说话人的turn可能重叠）
     current_time = None
-    current_spk_count = 0
 
-    for time, event_type in events:
-        if current_time is not None and time > current_time + EPSILON:
-            # 新增一个时间段（current_time 到 time）
-            time_segments.append((current_time, time, current_spk_count))
+    for time, event_type, spk in events:
+        # 时间段需长于0.01秒才计入说话人（与逐turn求重叠时的阈值一致，也覆盖了EPSILON以内的时间段）
+        if current_time is not None and time - current_time > 0.01:
+            s, e = current_time, time
+            current_speakers = {k for k, v in active_counts.items() if v > 0}
+            if current_speakers:
+                prev = labeled_segs[-1] if labeled_segs else None
+                if prev and s - prev[1] <= EPSILON and prev[2] == current_speakers:
+                    prev[1] = e  # 首尾相接且说话人一致，直接延长上一段
+                else:
+                    labeled_segs.append([s, e, current_speakers])
         # 更新当前状态
-        if event_type == "start":
-            current_spk_count += 1
-        else:
-            current_spk_count -= 1
+        active_counts[spk] = active_counts.get(spk, 0) + (1 if event_type == "start" else -1)
         current_time = time
 
-    # 步骤3：分类为“单人片段”和“mix片段”，并过滤短片段
+    # 步骤4：分类为“单人片段”和“mix片段”，并过滤短片段
     single_segs = []  # 格式：(start, end, speaker_list) —— speaker_list仅1个元素
     mix_segs = []  # 格式：(start, end, speaker_list) —— speaker_list≥2个元素
 
-    for s, e, spk_count in time_segments:
+    for s, e, current_speakers in labeled_segs:
         duration = e - s
         if duration < min_duration:
             continue  # 过滤短片段
-
-        # 找到该时间段内所有的说话人（去重）
-        current_speakers = set()
-        for turn_s, turn_e, spk in all_turns:
-            # 判断turn与当前时间段是否重叠（重叠部分≥0.01秒）
-            overlap_s = max(s, turn_s)
-            overlap_e = min(e, turn_e)
-            if overlap_e - overlap_s > 0.01:
-                current_speakers.add(spk)
         current_speakers = list(current_speakers)
 
         # 分类
         if len(current_speakers) == 1:
             single_segs.append((s, e, current_speakers[0]))
-        elif len(current_speakers) >= 2:
+        else:
             mix_segs.append((s, e, current_speakers))
 
     return single_segs, mix_segs
@@ -323,26 +338,16 @@ def get_unknown_segments(single_segs, mix_segs, total_duration):
     used_segs = single_segs + mix_segs
     if not used_segs:
         return [(0.0, total_duration)] if total_duration >= MIN_SEGMENT_DURATION else []
-    # 排序并合并已占用区间
+    # 排序后向量化求空白：已占用区间的结束时间取前缀最大值，即合并后区间的右边界，
+    # 某区间开始时间与之前的右边界相距≥MIN_SEGMENT_DURATION时，两者之间就是unknown区间
+    # （MIN_SEGMENT_DURATION远大于EPSILON，被合并的相邻区间不可能产生空白，无需逐个合并）
     used_segs.sort()
-    merged_used = [list(used_segs[0])]
-    for s, e in used_segs[1:]:
-        last_s, last_e = merged_used[-1]
-        if s <= last_e + EPSILON:
-            merged_used[-1][1] = max(last_e, e)
-        else:
-            merged_used.append([s, e])
-    # 计算未占用区间（unknown）
-    unknown_segs = []
-    prev_end = 0.0
-    for s, e in merged_used:
-        if s - prev_end >= MIN_SEGMENT_DURATION:
-            unknown_segs.append((prev_end, s))
-        prev_end = e
-    # 检查最后一段（merged_used结束到总时长）
-    if total_duration - prev_end >= MIN_SEGMENT_DURATION:
-        unknown_segs.append((prev_end, total_duration))
-    return unknown_segs
+    starts = np.array([s for s, _ in used_segs], dtype=np.float64)
+    covered_ends = np.maximum.accumulate(np.array([e for _, e in used_segs], dtype=np.float64))
+    gap_starts = np.concatenate(([0.0], covered_ends))  # 每个区间之前的已覆盖右边界（首个区间之前为0）
+    gap_ends = np.concatenate((starts, [total_duration]))  # 结尾空白以总时长收尾
+    keep = gap_ends - gap_starts >= MIN_SEGMENT_DURATION
+    return list(zip(gap_starts[keep].tolist(), gap_ends[keep].tolist()))
 
     # -------------------------- 新增4：合并音频并更新时间记录 --------------------------
 
@@ -389,6 +394,14 @@ def diarization(file_path, output_path):
     transcode_dir = transcode_dir.replace(os.sep, "/")
     os.makedirs(transcode_dir, exist_ok=True)
 
+    # 源文件的ffprobe探测（媒体类型/时长）与转码、说话人分离互不依赖：放到后台先跑，
+    # 返回前等待其完成，后续提取片段/拼接时直接命中util中的探测缓存
+    # （lru_cache不合并进行中的调用，不等待的话后续探测可能与其并发、重复执行ffprobe；
+    #  失败时异常留在Future中，届时会重新探测）
+    probe_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    probe_future = probe_executor.submit(get_media_duration, file_path)
+    probe_executor.shutdown(wait=False)
+
     # 转码
     convert_start = time.perf_counter()
     wav_path = convert_to_wav(file_path, transcode_dir)
@@ -441,9 +454,25 @@ def diarization(file_path, output_path):
     translate_dir = translate_dir.replace(os.sep, "/")
     os.makedirs(translate_dir, exist_ok=True)
 
+    # 说话人分离耗时远长于探测，这里通常无需等待
+    concurrent.futures.wait([probe_future])
     return diarize_result, output_dir, translate_dir, total_duration, wav_path, sr_orig
 
 
+def stitch_speaker_audio(**kwargs):
+    """
+    在拼接线程中执行stitch_segments_with_empty_timeline，日志先缓存不直接打印：
+    由主线程在对应说话人标题下统一打印，避免多个说话人的日志交错（main.py按行解析输出）
+    :return: (日志行列表, 拼接异常或None)
+    """
+    log_lines = []
+    try:
+        stitch_segments_with_empty_timeline(**kwargs, log=log_lines.append)
+    except Exception as e:
+        return log_lines, e
+    return log_lines, None
+
+
 def process_single_file(file_path, output_path):
     diarize_result, output_dir, translate_dir, total_duration, wav_path, sr_orig = (
         diarization(file_path, output_path)
@@ -468,6 +497,7 @@ def process_single_file(file_path, output_path):
     # -------------------------- 统一记录所有片段数据（含翻译） --------------------------
     all_records = []  # 存储所有片段记录：序号、开始、结束、时长、说话人、内容
     transcribe_tasks = []  # 待转录任务列表：(task_id, 片段路径, 临时目录)
+    extract_tasks = []  # 待提取片段列表：(片段路径, 开始, 结束)
     global_seq = 1  # 全局序号（跨类型连续）
     speaker_audio_map = {
         SPEAKER_TYPES["MIX"]: [],
@@ -478,6 +508,12 @@ def process_single_file(file_path, output_path):
     speaker_dir = os.path.join(output_dir, "speaker_audios")
     speaker_dir = speaker_dir.replace(os.sep, "/")
     os.makedirs(speaker_dir, exist_ok=True)
+    made_dirs = set()  # 已创建的片段目录（每个目录只makedirs一次，不再每个片段都stat/mkdir）
+
+    def ensure_dir(dir_path):
+        if dir_path not in made_dirs:
+            os.makedirs(dir_path, exist_ok=True)
+            made_dirs.add(dir_path)
 
     # （1）处理明确说话人（spkXX）
     for s, e, spk in single_segs:
@@ -488,12 +524,12 @@ def process_single_file(file_path, output_path):
             speaker_audio_map[spk_id] = []
         # 提取音频片段
         spk_dir = os.path.join(speaker_dir, spk_id).replace(os.sep, "/")
-        os.makedirs(spk_dir, exist_ok=True) 
+        ensure_dir(spk_dir)
         seg_path = os.path.join(spk_dir, f"seg_{global_seq}{seg_ext}").replace(
             os.sep, "/"
         )
         if EXTRACT_AUDIO_BY_ROLE:
-            extract_media_segment(file_path, seg_path, s, e)
+            extract_tasks.append((seg_path, s, e))
 
         # 记录数据
         all_records.append(
@@ -519,13 +555,13 @@ def process_single_file(file_path, output_path):
     for s, e, spk in mix_segs:
         duration = round(e - s, 2)
         mix_dir = os.path.join(speaker_dir, SPEAKER_TYPES["MIX"]).replace(os.sep, "/")
-        os.makedirs(mix_dir, exist_ok=True) 
+        ensure_dir(mix_dir)
         seg_path = os.path.join(mix_dir, f"seg_{global_seq}{seg_ext}").replace(
             os.sep, "/"
         )
         # 提取mix片段音频
         if EXTRACT_AUDIO_BY_ROLE:
-            extract_media_segment(file_path, seg_path, s, e)
+            extract_tasks.append((seg_path, s, e))
 
         # 记录数据（更新为实际转录内容）
         all_records.append(
@@ -553,12 +589,12 @@ def process_single_file(file_path, output_path):
         unknown_dir = os.path.join(speaker_dir, SPEAKER_TYPES["UNKNOWN"]).replace(
             os.sep, "/"
         )
-        os.makedirs(unknown_dir, exist_ok=True) 
+        ensure_dir(unknown_dir)
         seg_path = os.path.join(unknown_dir, f"seg_{global_seq}{seg_ext}").replace(
             os.sep, "/"
         )
         if EXTRACT_AUDIO_BY_ROLE:
-            extract_media_segment(file_path, seg_path, s, e)
+            extract_tasks.append((seg_path, s, e))
         # 记录数据（unknown无翻译内容）
         all_records.append(
             {
@@ -577,42 +613,75 @@ def process_single_file(file_path, output_path):
         )
         global_seq += 1
 
-    # -------------------------- 步骤2：并发执行转录任务（核心优化） --------------------------
-    if TRANSLATE and transcribe_tasks:
+    # -------------------------- 步骤1+2：并发提取音频片段，每组提取完立即提交该组的转录任务 --------------------------
+    # 按开始时间排序后分组：每组由一个ffmpeg进程输出多个片段（各片段在输入端单独定位）
+    # （按片段数和时间跨度共同分组：短片段密集时一组多装，稀疏时按跨度拆开并发读取）
+    extract_tasks.sort(key=lambda x: x[1])
+    extract_groups = group_segment_jobs(extract_tasks)
+    # 片段路径 → 转录任务（片段提取完成后才能转录，不再等所有分组都提取完）
+    pending_transcribe = (
+        {task[1]: task for task in transcribe_tasks} if TRANSLATE else {}
+    )
+    if extract_groups:
+        print(
+            f"\n=== 并发提取音频片段（{len(extract_tasks)}个，{len(extract_groups)}组，线程数：{EXTRACT_THREADS}）==="
+        )
+    if pending_transcribe:
         print(f"\n=== 并发转录语音片段（线程数：{TRANSCRIBE_THREADS}）===")
-        # 创建线程池（限制最大线程数，避免服务器拒绝连接）
-        with concurrent.futures.ThreadPoolExecutor(
-            max_workers=TRANSCRIBE_THREADS
-        ) as executor:
-            # 1. 提交所有转录任务到线程池
-            future_map = {}  # 关联：Future对象 → (任务ID, 片段路径)
-            for task in transcribe_tasks:
-                tid, spath, tdir = task
-                future = executor.submit(transcribe_with_qwen_asr, tid, spath, tdir)
-                future_map[future] = (tid, spath)
-
-            # 2. 异步获取结果并更新到all_records
-            completed_count = 0
-            total_tasks = len(transcribe_tasks)
-            for future in concurrent.futures.as_completed(future_map):
-                tid, spath = future_map[future]
-                try:
-                    # 获取转录结果（task_id, 内容）
-                    task_id, transcript = future.result()
-                    # 根据任务ID匹配并更新记录
-                    for record in all_records:
-                        if record["序号"] == task_id:
-                            record["说话内容"] = transcript
-                            break
-                    completed_count += 1
+
+    # 创建线程池（转录线程数限制最大值，避免服务器拒绝连接）
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=EXTRACT_THREADS
+    ) as extract_executor, concurrent.futures.ThreadPoolExecutor(
+        max_workers=TRANSCRIBE_THREADS
+    ) as executor:
+        future_map = {}  # 关联：Future对象 → (任务ID, 片段路径)
+
+        def submit_transcribe(seg_paths):
+            for spath in seg_paths:
+                task = pending_transcribe.pop(spath, None)
+                if task is not None:
+                    tid, spath, tdir = task
+                    future = executor.submit(transcribe_with_qwen_asr, tid, spath, tdir)
+                    future_map[future] = (tid, spath)
+
+        # 1. 提交所有提取任务；每组完成后立刻把该组片段的转录任务提交到转录线程池
+        group_futures = {
+            extract_executor.submit(extract_media_segments, file_path, group): group
+            for group in extract_groups
+        }
+        for group_future in concurrent.futures.as_completed(group_futures):
+            group_future.result()  # 任一片段失败直接抛错（与原串行逻辑一致）
+            submit_transcribe(spath for spath, _, _ in group_futures[group_future])
+        submit_transcribe(list(pending_transcribe))  # 兜底：不在提取列表中的片段
+
+        # 2. 异步获取结果并更新到all_records
+        completed_count = 0
+        total_tasks = len(future_map)
+        # 进度采样输出：约每2%打印一次（及最后一个），不再每完成一个片段就写一次stdout
+        report_every = max(1, total_tasks // 50)
+        # 序号 → 记录，按任务ID直接定位，不再每个结果都遍历全部记录
+        records_by_seq = {record["序号"]: record for record in all_records}
+        for future in concurrent.futures.as_completed(future_map):
+            tid, spath = future_map[future]
+            try:
+                # 获取转录结果（task_id, 内容）
+                task_id, transcript = future.result()
+                # 根据任务ID匹配并更新记录
+                record = records_by_seq.get(task_id)
+                if record is not None:
+                    record["说话内容"] = transcript
+                completed_count += 1
+                if completed_count % report_every == 0 or completed_count == total_tasks:
                     print(
                         f"✅ 进度：{completed_count}/{total_tasks} → 片段{tid}（{os.path.basename(spath)}）"
                     )
-                except Exception as e:
-                    print(
-                        f"❌ 转录线程异常 → 片段{tid}（{os.path.basename(spath)}）：{str(e)}"
-                    )
-    else:
+            except Exception as e:
+                print(
+                    f"❌ 转录线程异常 → 片段{tid}（{os.path.basename(spath)}）：{str(e)}"
+                )
+
+    if not TRANSLATE:
         # 未开启转录，更新占位符为“未翻译”
         for record in all_records:
             if record["说话内容"] == "待转录":
@@ -630,109 +699,131 @@ def process_single_file(file_path, output_path):
         json.dump(all_records_sorted, f, ensure_ascii=False, indent=2)
     print(f"✅ 原始时间顺序记录已保存：{raw_record_path}")
     # 2. 分说话人合并音频并保存【说话人合并后记录】
-    for speaker_id, audio_list in speaker_audio_map.items():
-        if not audio_list:
-            print(f"⚠️  说话人{speaker_id}无有效片段，跳过合并")
-            continue
-
-        # 步骤1：合并当前说话人的音频（按原始时间排序）
-        audio_list_sorted = sorted(audio_list, key=lambda x: x[1]) 
-
-        # 提前生成merged_path（和concat_audio_with_ffmpeg的路径完全一致）
-        merged_path = os.path.join(speaker_dir, speaker_id, f"merged{seg_ext}").replace(
+    # 各说话人的拼接互不依赖：先全部提交到有界线程池，下面按顺序等待各自结果
+    stitch_executor = concurrent.futures.ThreadPoolExecutor(max_workers=STITCH_WORKERS)
+    stitch_futures = {}
+    # 各说话人的合并路径只生成一次，提交拼接和后续记录共用
+    merged_paths = {
+        speaker_id: os.path.join(speaker_dir, speaker_id, f"merged{seg_ext}").replace(
             os.sep, "/"
         )
-
-        # 新增：打印当前合并模式（关键验证）
-        print(f"\n=== 处理说话人 {speaker_id} ===")
-        print(f"  保留时间线模式：{PRESERVE_TIMELINE}")
-        print(f"  提取音频开关：{EXTRACT_AUDIO_BY_ROLE}")
-        print(f"  合并路径：{merged_path}")
-
-        # 根据参数选择合并方式（两者均接收merged_path）
+        for speaker_id in speaker_audio_map
+    }
+    try:
         if EXTRACT_AUDIO_BY_ROLE:
-            stitch_segments_with_empty_timeline(
-                    media_list_sorted=audio_list_sorted,  
-                    model_input_path=file_path,
-                    output_path=merged_path,
-                    fill_empty=PRESERVE_TIMELINE,
-            )
-            print(f"✅ 拼接生成{'保留' if PRESERVE_TIMELINE else '无'}时间线 {speaker_id} 合并音频：{merged_path}") 
-            print(f"result_merge_speaker：{merged_path}")
-
-        # 步骤2：计算合并后的总时长和各片段相对时间
-        merged_seg_list = []
-        current_offset = 0.0  # 合并后的时间偏移（累计时长）
-
-        for seg_path, orig_s, orig_e, orig_duration in audio_list_sorted:
-            # 查找该片段的原始记录（获取说话内容）
-            seg_content = "未获取内容"
-            for raw_rec in all_records_sorted:
-                s_diff = abs(raw_rec["开始时间(秒)"] - orig_s)
-                e_diff = abs(raw_rec["结束时间(秒)"] - orig_e)
-                if (
-                    s_diff < EPSILON
-                    and e_diff < EPSILON
-                    and raw_rec["说话人"] == speaker_id
-                ):
-                    seg_content = raw_rec["说话内容"]
-                    break
-
-            # 记录合并后的片段信息
-            merged_seg = {
-                "原始序号": next(
-                    # 迭代器：寻找匹配的记录
-                    (
-                        rec["序号"]
-                        for rec in all_records_sorted
-                        if (
-                            abs(rec["开始时间(秒)"] - orig_s) < EPSILON * 2
-                        )  # 放宽精度到2倍误差
-                        and (
-                            abs(rec["结束时间(秒)"] - orig_e) < EPSILON * 2
-                        )  # 增加结束时间校验
-                        and rec["说话人"] == speaker_id
+            for speaker_id, audio_list in speaker_audio_map.items():
+                if audio_list:
+                    stitch_futures[speaker_id] = stitch_executor.submit(
+                        stitch_speaker_audio,
+                        media_list_sorted=sorted(audio_list, key=lambda x: x[1]),
+                        model_input_path=file_path,
+                        output_path=merged_paths[speaker_id],
+                        fill_empty=PRESERVE_TIMELINE,
+                        encode_threads=STITCH_ENCODE_THREADS,
+                    )
+        for speaker_id, audio_list in speaker_audio_map.items():
+            if not audio_list:
+                print(f"⚠️  说话人{speaker_id}无有效片段，跳过合并")
+                continue
+
+            # 步骤1：合并当前说话人的音频（按原始时间排序）
+            audio_list_sorted = sorted(audio_list, key=lambda x: x[1]) 
+
+            # 提前生成merged_path（和concat_audio_with_ffmpeg的路径完全一致）
+            merged_path = merged_paths[speaker_id]
+
+            # 新增：打印当前合并模式（关键验证）
+            print(f"\n=== 处理说话人 {speaker_id} ===")
+            print(f"  保留时间线模式：{PRESERVE_TIMELINE}")
+            print(f"  提取音频开关：{EXTRACT_AUDIO_BY_ROLE}")
+            print(f"  合并路径：{merged_path}")
+
+            # 根据参数选择合并方式（两者均接收merged_path）
+            if EXTRACT_AUDIO_BY_ROLE:
+                log_lines, stitch_error = stitch_futures[speaker_id].result()
+                for line in log_lines:
+                    print(line)
+                if stitch_error is not None:
+                    raise stitch_error  # 拼接失败直接抛错（与原串行逻辑一致）
+                print(f"✅ 拼接生成{'保留' if PRESERVE_TIMELINE else '无'}时间线 {speaker_id} 合并音频：{merged_path}") 
+                print(f"result_merge_speaker：{merged_path}")
+
+            # 步骤2：计算合并后的总时长和各片段相对时间
+            merged_seg_list = []
+            current_offset = 0.0  # 合并后的时间偏移（累计时长）
+
+            for seg_path, orig_s, orig_e, orig_duration in audio_list_sorted:
+                # 查找该片段的原始记录（获取说话内容）
+                seg_content = "未获取内容"
+                for raw_rec in all_records_sorted:
+                    s_diff = abs(raw_rec["开始时间(秒)"] - orig_s)
+                    e_diff = abs(raw_rec["结束时间(秒)"] - orig_e)
+                    if (
+                        s_diff < EPSILON
+                        and e_diff < EPSILON
+                        and raw_rec["说话人"] == speaker_id
+                    ):
+                        seg_content = raw_rec["说话内容"]
+                        break
+
+                # 记录合并后的片段信息
+                merged_seg = {
+                    "原始序号": next(
+                        # 迭代器：寻找匹配的记录
+                        (
+                            rec["序号"]
+                            for rec in all_records_sorted
+                            if (
+                                abs(rec["开始时间(秒)"] - orig_s) < EPSILON * 2
+                            )  # 放宽精度到2倍误差
+                            and (
+                                abs(rec["结束时间(秒)"] - orig_e) < EPSILON * 2
+                            )  # 增加结束时间校验
+                            and rec["说话人"] == speaker_id
+                        ),
+                        -1,  # 找不到时返回默认值-1，避免StopIteration
                     ),
-                    -1,  # 找不到时返回默认值-1，避免StopIteration
-                ),
-                "原始开始时间(秒)": round(orig_s, 2),
-                "原始结束时间(秒)": round(orig_e, 2),
-                "合并后开始时间(秒)": round(current_offset, 2),
-                "合并后结束时间(秒)": round(current_offset + orig_duration, 2),
-                "持续时间(秒)": orig_duration,
-                "说话内容": seg_content,
-            }
-            merged_seg_list.append(merged_seg)
-            current_offset += orig_duration
-
-        # 3. 单独保存【说话人合并后记录】（按说话人分组）
-        merged_record_path = os.path.join(
-            speaker_dir, speaker_id, f"{speaker_id}_合并后时间顺序记录.json"
-        ).replace(os.sep, "/")
-        try:
-            with open(merged_record_path, "w", encoding="utf-8") as f:
-                json.dump(merged_seg_list, f, ensure_ascii=False, indent=2)
-            print(f"✅ 说话人合并后记录已保存：{merged_record_path}")
-        except UnicodeEncodeError as e:
-            print(f"❌ {speaker_id}_合并后时间顺序记录.json未写入：{e}")
-            print(f"尝试清理数据中的非法字符后重新保存...")
-            # 清理数据中可能的编码问题
-            cleaned_list = []
-            for seg in merged_seg_list:
-                cleaned_seg = {}
-                for key, value in seg.items():
-                    if isinstance(value, str):
-                        # 移除或替换非法字符
-                        cleaned_seg[key] = value.encode('utf-8', errors='ignore').decode('utf-8')
-                    else:
-                        cleaned_seg[key] = value
-                cleaned_list.append(cleaned_seg)
+                    "原始开始时间(秒)": round(orig_s, 2),
+                    "原始结束时间(秒)": round(orig_e, 2),
+                    "合并后开始时间(秒)": round(current_offset, 2),
+                    "合并后结束时间(秒)": round(current_offset + orig_duration, 2),
+                    "持续时间(秒)": orig_duration,
+                    "说话内容": seg_content,
+                }
+                merged_seg_list.append(merged_seg)
+                current_offset += orig_duration
+
+            # 3. 单独保存【说话人合并后记录】（按说话人分组）
+            merged_record_path = os.path.join(
+                speaker_dir, speaker_id, f"{speaker_id}_合并后时间顺序记录.json"
+            ).replace(os.sep, "/")
             try:
                 with open(merged_record_path, "w", encoding="utf-8") as f:
-                    json.dump(cleaned_list, f, ensure_ascii=False, indent=2)
-                print(f"✅ 清理后成功保存：{merged_record_path}")
-            except Exception as e2:
-                print(f"❌ 清理后仍然失败：{e2}")
+                    json.dump(merged_seg_list, f, ensure_ascii=False, indent=2)
+                print(f"✅ 说话人合并后记录已保存：{merged_record_path}")
+            except UnicodeEncodeError as e:
+                print(f"❌ {speaker_id}_合并后时间顺序记录.json未写入：{e}")
+                print(f"尝试清理数据中的非法字符后重新保存...")
+                # 清理数据中可能的编码问题
+                cleaned_list = []
+                for seg in merged_seg_list:
+                    cleaned_seg = {}
+                    for key, value in seg.items():
+                        if isinstance(value, str):
+                            # 移除或替换非法字符
+                            cleaned_seg[key] = value.encode('utf-8', errors='ignore').decode('utf-8')
+                        else:
+                            cleaned_seg[key] = value
+                    cleaned_list.append(cleaned_seg)
+                try:
+                    with open(merged_record_path, "w", encoding="utf-8") as f:
+                        json.dump(cleaned_list, f, ensure_ascii=False, indent=2)
+                    print(f"✅ 清理后成功保存：{merged_record_path}")
+                except Exception as e2:
+                    print(f"❌ 清理后仍然失败：{e2}")
+    finally:
+        # 任一说话人拼接失败时取消尚未开始的拼接，不在报错后继续写出其他说话人的文件
+        stitch_executor.shutdown(cancel_futures=True)
     print(f"PROGRESS:100%")
 
     # 递归删除目录（包括所有子文件和子目录）
@@ -5,16 +5,18 @@ import pathlib
 import subprocess
 import platform
 
+# 平台只查询一次，检测逻辑直接复用
+_SYSTEM = platform.system()
 
 def _is_gpu_available(required_cuda_main=126):
     """内部函数：检测GPU和兼容CUDA，不对外暴露"""
     #return False
-    if platform.system() not in ["Windows", "Linux"]:
+    if _SYSTEM not in ["Windows", "Linux"]:
         return False
 
     # 调用nvidia-smi检测NVIDIA GPU
     try:
-        if platform.system() == "Windows":
+        if _SYSTEM == "Windows":
             result = subprocess.run(
                 ["cmd", "/c", "nvidia-smi"],
                 capture_output=True,
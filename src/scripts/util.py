@@ -4,18 +4,144 @@ import subprocess
 import re
 import time
 import shutil
+import tempfile
 import wave  # 需在文件顶部导入wave库
 from typing import List, Tuple
 import json
+import struct
+import concurrent.futures
+import threading
+from functools import lru_cache
+from fractions import Fraction
+
+# 平台判断只做一次（CREATE_NO_WINDOW仅Windows存在，其他平台传0）
+IS_WINDOWS = os.name == "nt"
+NO_WINDOW_FLAGS = subprocess.CREATE_NO_WINDOW if IS_WINDOWS else 0
+# 当前进程实际可用的CPU核数（容器/cgroup/taskset限制下os.cpu_count会返回整机核数；Windows无sched_getaffinity）
+CPU_COUNT = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+# 中间片段并发转码数（每个片段独立ffmpeg进程，绕开单线程concat滤镜瓶颈）
+INTERMEDIATE_WORKERS = max(1, min(4, CPU_COUNT))
+# 并发转码时每个ffmpeg进程分到的线程数（编码+滤镜），避免多进程同时抢满所有核心
+THREADS_PER_INTERMEDIATE = max(1, CPU_COUNT // INTERMEDIATE_WORKERS)
+# libx264参数：中间片段只做流复制拼接，关闭B帧和前瞻以换取编码速度
+X264_INTERMEDIATE_ARGS = ("-preset", "ultrafast", "-tune", "zerolatency", "-bf", "0", "-crf", "0")
+# 最终输出：无B帧+固定GOP，便于快速解码和拖动
+X264_OUTPUT_ARGS = ("-preset", "ultrafast", "-tune", "fastdecode", "-bf", "0", "-g", "48", "-crf", "23")
+# 同时运行的编码类ffmpeg进程上限（各线程池共用，线程数可以多于槽位）
+ENCODE_SLOTS = threading.BoundedSemaphore(INTERMEDIATE_WORKERS)
+# 单个ffmpeg进程一次输出的文件数上限（控制命令行长度，Windows约32K字符）
+MAX_OUTPUTS_PER_PROCESS = 32
+# 单个提取进程覆盖的时间跨度上限（秒）：各片段在输入端单独定位，跨度不影响读取量，
+# 按跨度拆组只是让时间上分散的片段分到多个进程并发提取
+MAX_SPAN_PER_PROCESS = 600
+# 视频中间片段封装参数：时间戳从0开始+统一时基，concat流复制时无需重写时间戳
+INTERMEDIATE_MUX_ARGS = ("-avoid_negative_ts", "make_zero", "-video_track_timescale", "90000")
+# 中间片段音频格式（pcm_s16le/44100Hz/立体声），所有中间片段一致才能流复制拼接
+INTERMEDIATE_SAMPLE_RATE = 44100
+INTERMEDIATE_CHANNELS = 2
+INTERMEDIATE_AUDIO_FORMAT_ARGS = (
+    "-ar", str(INTERMEDIATE_SAMPLE_RATE), "-ac", str(INTERMEDIATE_CHANNELS), "-channel_layout", "stereo"
+)
+INTERMEDIATE_AUDIO_ARGS = ("-c:a", "pcm_s16le", *INTERMEDIATE_AUDIO_FORMAT_ARGS)
+# 跳过中间WAV直接编码时先把解码结果转为s16（与中间WAV一致）：用aformat滤镜而非-sample_fmt，
+# 编码器再按自身支持的格式协商（libmp3lame只支持s16p等平面格式，-sample_fmt s16会直接报错）
+INTERMEDIATE_SAMPLE_FMT_ARGS = ("-af", "aformat=sample_fmts=s16")
+# 并发转码时单个ffmpeg进程的线程参数（输入侧滤镜线程/输出侧编码线程，数值固定只转换一次）
+INTERMEDIATE_FILTER_THREAD_ARGS = ("-filter_threads", str(THREADS_PER_INTERMEDIATE))
+INTERMEDIATE_THREAD_ARGS = ("-threads", str(THREADS_PER_INTERMEDIATE))
+# 最终音频编码器→可直接流复制的源编码（ffprobe codec_name），源编码相同时拼接无需重新编码
+# 只收录concat流复制后时长正确的编码：FLAC片段各自带STREAMINFO和时间戳，拼接后头部时长错误，必须重新编码
+STREAM_COPY_SOURCE_CODECS = {"libmp3lame": "mp3"}
+# 最终输出格式→(编码器, 编码参数)映射，按扩展名查表
+FINAL_FORMAT_ENCODERS = {
+    "video": {
+        ".mp4": ("libx264", X264_OUTPUT_ARGS),
+        ".avi": ("mpeg4", ("-qscale:v", "2")),
+        ".mov": ("libx264", X264_OUTPUT_ARGS),
+        ".mkv": ("libx264", X264_OUTPUT_ARGS)
+    },
+    "audio": {
+        ".wav": ("copy", ()),
+        ".mp3": ("libmp3lame", ("-b:a", "192k")),
+        ".flac": ("flac", ()),
+        ".aac": ("aac", ("-b:a", "128k"))
+    }
+}
+# 内存盘目录（Linux tmpfs），中间文件优先写到这里以避免磁盘读写
+RAM_DISK_DIR = "/dev/shm"
+# 子进程环境：传递UTF-8环境变量，强制ffmpeg输出英文，减少中文解码问题（只构造一次，所有调用共用）
+FFMPEG_ENV = {**os.environ, "LC_ALL": "en_US.UTF-8", "LANG": "en_US.UTF-8"}
+# 生成类ffmpeg命令的公共前缀（覆盖输出+隐藏版本信息+只输出错误日志，不产生进度统计）
+FFMPEG_CMD_PREFIX = ("ffmpeg", "-y", "-hide_banner", "-loglevel", "error", "-nostats")
+# 中间片段转码命令中输入路径之前的固定部分（源片段为流复制截取，缺失的PTS由ffmpeg补齐）
+TRANSCODE_INPUT_ARGS = (*FFMPEG_CMD_PREFIX, *INTERMEDIATE_FILTER_THREAD_ARGS, "-fflags", "+genpts", "-i")
+# 等比例缩放+黑边填充滤镜模板（min()内的逗号需转义）
+ALIGN_FILTER_TMPL = "scale=w=min({w}\\,iw*sar):h=min({h}\\,ih),pad={w}:{h}:(ow-iw)/2:(oh-ih)/2:black"
+# 空片段黑画面/静音源模板
+BLACK_SOURCE_TMPL = "color=c=black:s={w}x{h}:r={fps}"
+SILENCE_SOURCE_TMPL = "anullsrc=r={sr}:cl={layout}"
+# concat列表行模板（片段路径均为绝对路径）
+CONCAT_LINE_TMPL = "file '{}'\n"
+# ffmpeg -i 输出中音频流描述的解析正则（模块加载时编译一次）
+AUDIO_STREAM_RE = re.compile(r"Stream #\d+:\d+.*?Audio: (.*)")
+PCM_S16_RE = re.compile(r"pcm_s16le|pcm_s16be|pcm_s16")
+CHANNELS_RE = re.compile(r"(\d+) (channels?|声道)")
+SAMPLE_RATE_RE = re.compile(r"(\d+) Hz")
+BIT_DEPTH_RE = re.compile(r"s(16|24|32)")
+# 失败时错误信息最多保留的stderr尾部长度
+FFMPEG_ERR_TAIL = 2000
+
+def run_ffmpeg(cmd, env=FFMPEG_ENV, on_progress=None):
+    """
+    执行生成类ffmpeg命令：stderr写入临时文件而非管道（无需边运行边排空），
+    成功时不读取也不解码，只有失败才读回错误信息
+    :param on_progress: 可选回调，参数为已输出的媒体时长（秒），由-progress逐行上报；返回False时终止ffmpeg
+    :return: (返回码, 错误信息尾部)
+    """
+    with tempfile.TemporaryFile() as err_file:
+        if on_progress is None:
+            proc = subprocess.Popen(
+                cmd, env=env, stdout=subprocess.DEVNULL, stderr=err_file, stdin=subprocess.DEVNULL,
+                creationflags=NO_WINDOW_FLAGS,
+            )
+        else:
+            # -progress把key=value进度写到stdout（只解析out_time_ms，单位实为微秒），stderr仍只记录错误
+            proc = subprocess.Popen(
+                [cmd[0], "-progress", "pipe:1", *cmd[1:]],
+                env=env, stdout=subprocess.PIPE, stderr=err_file, stdin=subprocess.DEVNULL,
+                creationflags=NO_WINDOW_FLAGS,
+            )
+            with proc.stdout:
+                for line in proc.stdout:
+                    if not line.startswith(b"out_time_ms="):
+                        continue
+                    try:
+                        out_sec = int(line[12:]) / 1e6
+                    except ValueError:  # 开始阶段为N/A
+                        continue
+                    if on_progress(out_sec) is False:
+                        proc.terminate()
+                        break
+        returncode = proc.wait()
+        if returncode == 0:
+            return 0, ""
+        err_file.seek(max(0, err_file.tell() - FFMPEG_ERR_TAIL * 4))  # UTF-8单字符最多4字节
+        return returncode, err_file.read().decode("utf-8", errors="ignore")[-FFMPEG_ERR_TAIL:]
+
 
 def get_audio_info(input_path):
     # 转绝对路径
     input_path = os.path.abspath(input_path).replace(os.sep, "/")
+    # 同一文件（mtime/大小未变）只探测一次：转码判断、逐片段提取等处反复查询原音频参数时复用结果
+    # 返回副本，调用方修改不会污染缓存
+    return dict(_probe_audio_info(input_path, _file_cache_key(input_path)))
+
+
+@lru_cache(maxsize=256)
+def _probe_audio_info(input_path: str, cache_key) -> dict:
     cmd = ["ffmpeg", "-hide_banner", "-i", input_path]
     # 关键：传递UTF-8环境变量，避免ffmpeg输出中文；同时指定encoding="utf-8"
-    env = os.environ.copy()
-    env["LC_ALL"] = "en_US.UTF-8"  # 强制ffmpeg输出英文，减少中文解码问题
-    env["LANG"] = "en_US.UTF-8"
+    env = FFMPEG_ENV
     try:
         # 必须添加 encoding="utf-8"，避免subprocess默认用GBK读取输出
         result = subprocess.run(
@@ -30,42 +156,28 @@ def get_audio_info(input_path):
         raise RuntimeError("ffmpeg 未找到，请配置到 PATH 环境变量中。")
     output = result.stderr if result.stderr else result.stdout
     audio_info = {}
-    audio_stream_line = re.search(r"Stream #\d+:\d+.*?Audio: (.*)", output)
+    audio_desc = ""
+    audio_stream_line = AUDIO_STREAM_RE.search(output)
     if audio_stream_line:
         audio_desc = audio_stream_line.group(1)
-        audio_info["codec"] = (
-            re.search(r"pcm_s16le|pcm_s16be|pcm_s16", audio_desc).group(0)
-            if re.search(r"pcm_s16le|pcm_s16be|pcm_s16", audio_desc)
-            else None
-        )
-        audio_info["channels"] = (
-            2
-            if "stereo" in audio_desc
-            else (
-                1
-                if "mono" in audio_desc
-                else (
-                    int(re.search(r"(\d+) (channels?|声道)", audio_desc).group(1))
-                    if re.search(r"(\d+) (channels?|声道)", audio_desc)
-                    else None
-                )
-            )
-        )
-        audio_info["sample_rate"] = (
-            int(re.search(r"(\d+) Hz", audio_desc).group(1))
-            if re.search(r"(\d+) Hz", audio_desc)
-            else None
-        )
-        audio_info["bit_depth"] = 16 if re.search(r"s16", audio_desc) else None
-        # 修复bit_depth提取：如果无法识别，默认16位
-    if re.search(r"s16", audio_desc):
-        audio_info["bit_depth"] = 16
-    elif re.search(r"s24", audio_desc):
-        audio_info["bit_depth"] = 24
-    elif re.search(r"s32", audio_desc):
-        audio_info["bit_depth"] = 32
-    else:
-        audio_info["bit_depth"] = 16  # 默认16位，避免None
+        # 每个字段只匹配一次（预编译正则，不再“先判断再重复搜索”）
+        codec_match = PCM_S16_RE.search(audio_desc)
+        audio_info["codec"] = codec_match.group(0) if codec_match else None
+        if "stereo" in audio_desc:
+            audio_info["channels"] = 2
+        elif "mono" in audio_desc:
+            audio_info["channels"] = 1
+        else:
+            channels_match = CHANNELS_RE.search(audio_desc)
+            audio_info["channels"] = int(channels_match.group(1)) if channels_match else None
+        sample_rate_match = SAMPLE_RATE_RE.search(audio_desc)
+        audio_info["sample_rate"] = int(sample_rate_match.group(1)) if sample_rate_match else None
+    # 修复bit_depth提取：如果无法识别，默认16位
+    # 一次扫描取出所有位深标记，再按 s16 > s24 > s32 的原有优先级选取
+    depths = set(BIT_DEPTH_RE.findall(audio_desc))
+    audio_info["bit_depth"] = next(
+        (int(d) for d in ("16", "24", "32") if d in depths), 16  # 默认16位，避免None
+    )
     return audio_info
 
 
@@ -91,14 +203,11 @@ def convert_to_wav(input_path, output_dir):
     output_wav = output_wav.replace(os.sep, "/")  # 统一分隔符
 
     # 关键：传递UTF-8环境变量，避免ffmpeg输出中文；同时指定encoding="utf-8"
-    env = os.environ.copy()
-    env["LC_ALL"] = "en_US.UTF-8"  # 强制ffmpeg输出英文，减少中文解码问题
-    env["LANG"] = "en_US.UTF-8"
+    env = FFMPEG_ENV
 
     # 列表形式调用 ffmpeg，避免转义
     cmd = [
-        "ffmpeg",
-        "-y",
+        *FFMPEG_CMD_PREFIX,  # 只输出错误日志，不产生进度统计
         "-threads",
         "0",
         "-i",
@@ -111,16 +220,10 @@ def convert_to_wav(input_path, output_dir):
         "s16",
         output_wav,
     ]
-    subprocess.run(
-        cmd,
-        check=True,
-        text=True,
-        env=env,
-        encoding="utf-8",
-        stdout=subprocess.DEVNULL,  # 丢弃 stdout
-        stderr=subprocess.PIPE,  # 捕获 stderr
-        creationflags=subprocess.CREATE_NO_WINDOW,  # 关键参数
-    )
+    # stderr不走管道：成功时不读取不解码，失败时才取回错误信息
+    returncode, err = run_ffmpeg(cmd, env=env)
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd, stderr=err)
     # 新增：校验转码后的WAV文件有效性
     if not os.path.exists(output_wav):
         raise RuntimeError(f"转码失败：未生成WAV文件（{output_wav}）")
@@ -189,14 +292,11 @@ def extract_audio_segment(input_path, output_path, start_sec, end_sec):
             codec = "pcm_s16le"  # 未知位深时降级为16位（保底）
             print(f"⚠️  原音频位深{bit_depth}不支持，临时片段将使用16位PCM")
 
-        env = os.environ.copy()
-        env["LC_ALL"] = "en_US.UTF-8"
-        env["LANG"] = "en_US.UTF-8"
+        env = FFMPEG_ENV
 
         # 核心命令：仅转换为WAV封装，参数与原音频一致（无损）
         cmd = [
-            "ffmpeg",
-            "-y",  # 覆盖输出
+            *FFMPEG_CMD_PREFIX,  # 覆盖输出，只输出错误日志
             "-ss",
             str(start_sec),  # 开始时间
             "-to",
@@ -213,16 +313,9 @@ def extract_audio_segment(input_path, output_path, start_sec, end_sec):
             str(channels),  # 声道数与原音频一致
             output_path,
         ]
-        result = subprocess.run(
-            cmd,
-            env=env,
-            text=True,
-            encoding="utf-8",
-            stdout=subprocess.DEVNULL,  # 丢弃 stdout
-            stderr=subprocess.PIPE,  # 捕获 stderr
-            creationflags=subprocess.CREATE_NO_WINDOW,  # 关键参数
-        )
-        result.check_returncode()
+        returncode, err = run_ffmpeg(cmd, env=env)
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, cmd, stderr=err)
     except subprocess.CalledProcessError as e:
         raise RuntimeError(f"提取片段失败（{output_path}）：{e.stderr}")
     except OSError as e:
@@ -248,13 +341,11 @@ def concat_audio_with_ffmpeg(input_paths, output_path):
 
     # 生成 concat 列表（绝对路径 + 无引号）
     with open(list_path, "w", encoding="utf-8") as f:
-        for path in input_paths:
-            f.write(f"file {path}\n")  # 关键：无引号，绝对路径
+        f.write("".join(f"file {path}\n" for path in input_paths))  # 关键：无引号，绝对路径
 
     # 列表形式调用 ffmpeg
     cmd = [
-        "ffmpeg",
-        "-y",
+        *FFMPEG_CMD_PREFIX,
         "-f",
         "concat",
         "-safe",
@@ -266,20 +357,16 @@ def concat_audio_with_ffmpeg(input_paths, output_path):
         output_path,
     ]
     # 关键：传递UTF-8环境变量，避免ffmpeg输出中文；同时指定encoding="utf-8"
-    env = os.environ.copy()
-    env["LC_ALL"] = "en_US.UTF-8"  # 强制ffmpeg输出英文，减少中文解码问题
-    env["LANG"] = "en_US.UTF-8"
+    env = FFMPEG_ENV
     print(f"result:10")
-    result = subprocess.run(
-        cmd, capture_output=True, text=True, env=env, encoding="utf-8"
-    )
+    returncode, err = run_ffmpeg(cmd, env=env)
     os.remove(list_path)  # 删除临时列表
 
     print(
         f"  [耗时] 音频合并：{time.perf_counter() - concat_audio_with_ffmpeg_consume:.2f} 秒"
     )
-    if result.returncode != 0:
-        raise RuntimeError(f"拼接音频失败：{result.stderr}")
+    if returncode != 0:
+        raise RuntimeError(f"拼接音频失败：{err}")
 
 
 def generate_full_timeline_audio(
@@ -549,50 +636,89 @@ def generate_full_timeline_audio(
                 f"✅ 帧数匹配！生成音频时长：{final_frame_count/sr_orig:.2f}秒（与原音频一致）"
             )
 
-    # 用ffmpeg验证生成的音频信息（最权威验证）
-    cmd = ["ffmpeg", "-hide_banner", "-i", merged_path]
-    env = os.environ.copy()
-    env["LC_ALL"] = "en_US.UTF-8"
-    result = subprocess.run(
-        cmd,
-        capture_output=True,
-        text=True,
-        env=env,
-        encoding="utf-8",
-        stdin=subprocess.DEVNULL,
-    )
-    print(f"\n  ffmpeg验证生成的音频信息：")
-    for line in result.stderr.splitlines():
-        if "Duration" in line or "Audio" in line:
-            print(f"  {line}")  # 打印时长和音频参数
+    # 读回生成文件的WAV头验证音频信息（不再启动ffmpeg并捕获整段输出）
+    params = read_wav_params(merged_path)
+    print(f"\n  验证生成的音频信息：")
+    if params:
+        print(
+            f"  时长：{params.nframes / params.framerate:.2f}秒，采样率：{params.framerate}Hz，"
+            f"声道：{params.nchannels}，位深：{params.sampwidth * 8}位"
+        )
+    else:
+        print(f"  ⚠️  无法读取WAV头：{merged_path}")
 
     print(f"✅ 生成 {speaker_id} 完整时间线音频：{merged_path}")
     return merged_path
 
 
+def read_wav_params(input_path):
+    """
+    直接读取PCM WAV的RIFF头（声道/位宽/采样率/帧数），不启动子进程
+    :return: wave参数（namedtuple），非WAV或wave库无法解析的头（如浮点WAV）返回None
+    """
+    if not input_path.lower().endswith(".wav"):
+        return None
+    try:
+        with wave.open(input_path, "rb") as wf:
+            return wf.getparams()
+    except (wave.Error, EOFError, OSError):
+        return None
+
+
+def read_mp4_duration(input_path):
+    """
+    直接读取MP4/MOV的moov/mvhd盒子获取时长，不启动子进程（只读盒子头，不读媒体数据）
+    :return: 时长（秒），非MP4/MOV或结构无法解析时返回None
+    """
+    if not input_path.lower().endswith((".mp4", ".mov")):
+        return None
+    try:
+        with open(input_path, "rb") as f:
+            end = os.fstat(f.fileno()).st_size
+            pos = 0
+            while pos + 8 <= end:
+                f.seek(pos)
+                size, box_type = struct.unpack(">I4s", f.read(8))
+                header = 8
+                if size == 1:  # 64位长度
+                    size = struct.unpack(">Q", f.read(8))[0]
+                    header = 16
+                elif size == 0:  # 延伸到文件末尾
+                    size = end - pos
+                if size < header:
+                    return None
+                if box_type == b"moov":
+                    # 进入moov查找子盒子mvhd
+                    end = pos + size
+                    pos += header
+                    continue
+                if box_type == b"mvhd":
+                    version = f.read(1)[0]
+                    f.seek(3 + (16 if version == 1 else 8), os.SEEK_CUR)  # 跳过flags和创建/修改时间
+                    if version == 1:
+                        timescale, duration = struct.unpack(">IQ", f.read(12))
+                    else:
+                        timescale, duration = struct.unpack(">II", f.read(8))
+                    return duration / timescale if timescale else None
+                pos += size
+    except (OSError, struct.error, IndexError):
+        return None
+    return None
+
+
 def get_audio_duration(input_path):
     """单独提取原音频的真实总时长（修复核心）"""
     input_path = os.path.abspath(input_path).replace(os.sep, "/")
-    cmd = ["ffmpeg", "-hide_banner", "-i", input_path]
-    env = os.environ.copy()
-    env["LC_ALL"] = "en_US.UTF-8"
-    env["LANG"] = "en_US.UTF-8"
-    result = subprocess.run(
-        cmd,
-        capture_output=True,
-        text=True,
-        env=env,
-        encoding="utf-8",
-        stdin=subprocess.DEVNULL,
-    )
-    output = result.stderr if result.stderr else result.stdout
+    # WAV（转码后的模型输入）直接读RIFF头：帧数/采样率即时长，无需启动子进程
+    wav_params = read_wav_params(input_path)
+    if wav_params:
+        return wav_params.nframes / wav_params.framerate
 
-    # 优先解析 Duration 字段（格式：00:01:23.45）
-    duration_match = re.search(r"Duration: (\d+:\d+:\d+\.\d+)", output)
-    if duration_match:
-        h, m, s = duration_match.group(1).split(":")
-        total_duration = float(h) * 3600 + float(m) * 60 + float(s)
-        return total_duration
+    # 其他容器用ffprobe读取时长（只解析头信息，结果与拼接阶段共用缓存）
+    try:
+        return get_media_duration(input_path)
+    except RuntimeError:
+        pass
 
     # 降级方案：用转码后的WAV时长（仅当原解析失败时）
     wav_path = convert_to_wav(
@@ -606,105 +732,133 @@ def get_audio_duration(input_path):
     return transcode_duration
 
 
-def extract_media_segment(input_path, output_path, start_sec, end_sec):
-    try:
-        input_path = os.path.abspath(input_path).replace(os.sep, "/")
-        output_path = os.path.abspath(output_path).replace(os.sep, "/")
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-
-        # 1. 判断输入是视频还是音频
-        media_type = get_media_type(input_path)
-        is_video = media_type == "video"  # 安全访问，默认False
-        is_audio = media_type == "audio"  # 安全访问，默认False
-
-        if not (is_video or is_audio):
-            raise RuntimeError(f"输入文件不是有效的视频或音频：{input_path}")
+def format_seconds(sec: float) -> str:
+    """秒数转为ffmpeg时间参数：保留微秒精度、去掉末尾多余的0（不用%g，避免出现ffmpeg不认的科学计数法）"""
+    text = f"{sec:.6f}".rstrip("0").rstrip(".")
+    return "0" if text in ("", "-0") else text
 
-        # 2. 构造ffmpeg命令（核心：流复制，保持原格式）
-        env = os.environ.copy()
-        env["LC_ALL"] = "en_US.UTF-8"
-        env["LANG"] = "en_US.UTF-8"
 
-        cmd = [
-            "ffmpeg",
-            "-y",  # 覆盖输出
-            "-ss",
-            str(start_sec),  # 开始时间（秒）
-            "-to",
-            str(end_sec),  # 结束时间（秒）
-            "-i",
-            input_path,  # 输入文件
-        ]
-
-        # 关键：使用流复制（-c copy），不重新编码，保持原格式和质量
-        # 视频文件保留视频流和音频流，音频文件只保留音频流
-        if is_video:
-            cmd.extend(["-c:v", "copy"])  # 复制视频流
-            if is_audio:
-                cmd.extend(["-c:a", "copy"])  # 同时复制音频流（若有）
-        else:  # 纯音频
-            cmd.extend(["-c:a", "copy"])  # 复制音频流
-
-        # 输出路径（需确保扩展名与原格式一致，如输入video.mp4，输出xxx.mp4）
-        cmd.append(output_path)
-
-        # 执行命令
-        result = subprocess.run(
-            cmd,
-            env=env,
-            text=True,
-            encoding="utf-8",
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.PIPE,
-            creationflags=subprocess.CREATE_NO_WINDOW,
-        )
-        result.check_returncode()
+def extract_media_segments(input_path, jobs):
+    """
+    批量提取片段：一个ffmpeg进程输出多个片段，每个片段对应一个输入端-ss/-to定位的输入（流复制）
+    :param input_path: 原媒体文件
+    :param jobs: [(输出路径, 开始秒, 结束秒), ...]
+    :return: 输出路径列表（与jobs顺序一致）
+    """
+    input_path = os.path.abspath(input_path).replace(os.sep, "/")
+    media_type = get_media_type(input_path)  # 整批只探测一次
+    copy_args = ["-c:v", "copy", "-c:a", "copy"] if media_type == "video" else ["-c:a", "copy"]
+    if media_type == "audio":
+        # 纯音频流复制截取：首包时间戳统一平移到从0开始
+        # （视频不加：输入端定位后关键帧前的预读包带负时间戳，由封装的编辑列表隐藏；
+        #  平移到0会让预读画面变成片段开头，片段变长且音画错位）
+        copy_args += ["-avoid_negative_ts", "make_zero"]
+
+    # 每个片段单独作为一个输入并在输入端定位：
+    # 视频流复制时只能从关键帧开始，输出端-ss会丢掉定位点到下一个关键帧之间的画面，
+    # 输入端-ss则从定位点之前的关键帧读起，片段开头不丢帧
+    cmd = [*FFMPEG_CMD_PREFIX]
+    for _, start_sec, end_sec in jobs:
+        cmd.extend([
+            "-fflags", "+genpts",  # 裸流（aac/mp3等）缺失的PTS由ffmpeg补齐
+            "-ss", format_seconds(start_sec), "-to", format_seconds(end_sec),
+            "-i", input_path,
+        ])
+    output_paths = []
+    made_dirs = set()  # 同组片段多在同一目录，每个目录只创建一次
+    for input_idx, (output_path, _, _) in enumerate(jobs):
+        output_path = os.path.abspath(output_path).replace(os.sep, "/")
+        output_dir = os.path.dirname(output_path)
+        if output_dir not in made_dirs:
+            os.makedirs(output_dir, exist_ok=True)
+            made_dirs.add(output_dir)
+        # 第N个输出只映射第N个输入（视频文件保留视频流和音频流，音频文件只保留音频流）
+        if media_type == "video":
+            map_args = ["-map", f"{input_idx}:v:0?", "-map", f"{input_idx}:a:0?"]
+        else:
+            map_args = ["-map", f"{input_idx}:a:0"]
+        cmd.extend([*map_args, *copy_args, output_path])
+        output_paths.append(output_path)
 
-        # 校验输出文件
-        if not os.path.exists(output_path):
-            raise RuntimeError(f"片段提取失败：未生成文件（{output_path}）")
-        if os.path.getsize(output_path) < 1024:
+    try:
+        returncode, err = run_ffmpeg(cmd)
+    except OSError as e:
+        if e.errno == 28:
+            raise RuntimeError(f"磁盘空间不足，无法保存片段：{os.path.dirname(output_paths[0])}")
+        raise RuntimeError(f"IO错误（{input_path}）：{str(e)}")
+    if returncode != 0:
+        raise RuntimeError(f"批量提取片段失败（{input_path}）：{err}")
+
+    # 校验输出文件
+    for output_path in output_paths:
+        if not os.path.exists(output_path) or os.path.getsize(output_path) < 1024:
             raise RuntimeError(
                 f"提取的片段为空（{output_path}），可能原文件损坏或时间区间无效"
             )
+    return output_paths
 
-        return output_path
 
-    except subprocess.CalledProcessError as e:
-        # 特殊处理：部分格式不支持流复制（如某些古老格式），可尝试重新编码（可选）
-        if (
-            "Invalid codec for stream" in e.stderr
-            or "could not find codec parameters" in e.stderr
+def group_segment_jobs(jobs):
+    """
+    把按开始时间排序的提取任务分组，每组交给一次extract_media_segments：
+    组内片段数不超过MAX_OUTPUTS_PER_PROCESS，且首片段开始到末片段结束不超过MAX_SPAN_PER_PROCESS秒
+    :param jobs: [(输出路径, 开始秒, 结束秒), ...]（需已按开始时间排序）
+    :return: [[job, ...], ...]
+    """
+    groups = []
+    current = []
+    group_start = 0.0
+    for job in jobs:
+        if current and (
+            len(current) >= MAX_OUTPUTS_PER_PROCESS
+            or job[2] - group_start > MAX_SPAN_PER_PROCESS
         ):
-            raise RuntimeError(f"格式不支持无损提取，需重新编码：{e.stderr}")
-        else:
-            raise RuntimeError(f"提取片段失败（{output_path}）：{e.stderr}")
-    except OSError as e:
-        if e.errno == 28:
-            raise RuntimeError(f"磁盘空间不足，无法保存片段：{output_path}")
-        elif e.errno == 13:
-            raise RuntimeError(f"无写权限，无法保存片段：{output_path}")
-        else:
-            raise RuntimeError(f"IO错误（{output_path}）：{str(e)}")
+            groups.append(current)
+            current = []
+        if not current:
+            group_start = job[1]
+        current.append(job)
+    if current:
+        groups.append(current)
+    return groups
+
+
+def _file_cache_key(input_path: str):
+    """探测结果缓存键：文件被覆盖/修改后（mtime或大小变化）自动失效"""
+    try:
+        stat = os.stat(input_path)
+        return stat.st_mtime_ns, stat.st_size
+    except OSError:
+        return None
+
+
+@lru_cache(maxsize=256)
+def _probe_media(input_path: str, cache_key) -> dict:
+    """
+    一次ffprobe同时取回流信息和总时长，类型/信息/时长三个查询共用
+    同一文件（同一mtime/大小）只探测一次；失败直接抛错（异常不会被缓存）
+    """
+    cmd = [
+        "ffprobe",
+        "-v", "error",
+        "-show_entries",
+        "stream=codec_type,codec_name,sample_rate,channels,channel_layout,width,height,r_frame_rate,sample_fmt"
+        ":format=duration",
+        "-of", "json",
+        input_path
+    ]
+    result = subprocess.run(
+        cmd, capture_output=True, env=FFMPEG_ENV, text=True, encoding="utf-8", stdin=subprocess.DEVNULL
+    )
+    result.check_returncode()
+    return json.loads(result.stdout)
 
 
 def get_media_type(input_path: str) -> str:
     """判断媒体文件类型（音频/视频），返回 'audio' 或 'video'"""
     input_path = os.path.abspath(input_path)
-    env = os.environ.copy()
-    env["LC_ALL"] = "en_US.UTF-8"
-
     try:
-        cmd = [
-            "ffprobe", "-v", "error", "-show_entries", "stream=codec_type",
-            "-of", "json", input_path
-        ]
-        result = subprocess.run(
-            cmd, capture_output=True, env=env, text=True, encoding="utf-8", stdin=subprocess.DEVNULL
-        )
-        result.check_returncode() 
-        info = json.loads(result.stdout)
-        streams = info.get("streams", [])
+        streams = _probe_media(input_path, _file_cache_key(input_path)).get("streams", [])
         return "video" if any(s.get("codec_type") == "video" for s in streams) else "audio"
     except Exception as e:
         ext = os.path.splitext(input_path)[1].lower()
@@ -720,8 +874,6 @@ def get_media_type(input_path: str) -> str:
 def get_media_info(input_path: str) -> dict:
     """纯工具函数：仅解析媒体文件的原始信息，不处理特殊逻辑，失败直接抛错"""
     input_path = os.path.abspath(input_path)
-    env = os.environ.copy()
-    env["LC_ALL"] = "en_US.UTF-8"
 
     # 初始化返回结构（仅包含默认键，值由解析填充）
     media_info = {
@@ -734,30 +886,13 @@ def get_media_info(input_path: str) -> dict:
         "height": None,  # 高度（视频）
         "fps": None,  # 帧率（视频）
         "sample_fmt": None,  # 样本格式（音频）
+        "audio_codec": None,  # 编码格式（音频）
         "format": os.path.splitext(input_path)[1].lower()  # 文件扩展名
     }
 
     try:
-        # 调用ffprobe获取流信息
-        cmd = [
-            "ffprobe",
-            "-v", "error",
-            "-show_entries", "stream=codec_type,sample_rate,channels,channel_layout,width,height,r_frame_rate,sample_fmt",
-            "-of", "json",
-            input_path
-        ]
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            env=env,
-            text=True,
-            encoding="utf-8",
-            stdin=subprocess.DEVNULL
-        )
-        result.check_returncode()  # 解析失败直接抛错
-
-        import json
-        info = json.loads(result.stdout)
+        # 共用缓存的ffprobe结果（解析失败直接抛错）
+        info = _probe_media(input_path, _file_cache_key(input_path))
         streams = info.get("streams", [])
 
         # 提取视频/音频流信息（仅做解析，不做强制修改）
@@ -777,6 +912,7 @@ def get_media_info(input_path: str) -> dict:
                 media_info["channels"] = int(stream["channels"]) if stream.get("channels") else None
                 media_info["channel_layout"] = stream.get("channel_layout")
                 media_info["sample_fmt"] = stream.get("sample_fmt")
+                media_info["audio_codec"] = stream.get("codec_name")
 
         return media_info
 
@@ -784,72 +920,109 @@ def get_media_info(input_path: str) -> dict:
         # 只抛错，不做兜底（兜底由上层业务决定）
         raise RuntimeError(f"解析媒体信息失败（{input_path}）：{str(e)}")
 
-def generate_empty_media_segment(
-    media_type: str, 
-    duration: float, 
-    output_dir: str, 
-    seg_id: str,
-    ref_width: int,   
-    ref_height: int, 
-    ref_fps: float   
-) -> str:
-    """生成空片段时，直接使用参考分辨率和帧率"""
-    env = os.environ.copy()
-    env["LC_ALL"] = "en_US.UTF-8"
-    cmd = ["ffmpeg", "-y", "-hide_banner", "-t", f"{duration:.4f}"]
+def generate_empty_media_segments(
+    media_type: str,
+    jobs: List[Tuple[float, str]],
+    output_dir: str,
+    ref_width: int,
+    ref_height: int,
+    ref_fps: float,
+    verbose: bool = True
+) -> List[str]:
+    """
+    一个ffmpeg进程批量生成多个空片段：黑画面/静音源只初始化一次，按各输出的-t截取
+    :param jobs: [(时长, 片段ID), ...]
+    :param verbose: 是否逐个打印生成结果（线程池内批量调用时关闭，由调用方汇总）
+    :return: 空片段路径列表（与jobs顺序一致）
+    """
+    env = FFMPEG_ENV
+    cmd = [*FFMPEG_CMD_PREFIX]
 
-    # 音频参数不变
+    # 音频参数与中间片段一致
     sr = 44100
-    channels = 2
     channel_layout = "stereo"
 
     if media_type == "video":
         # 核心修改：空片段使用参考分辨率和帧率
-        output_path = os.path.join(output_dir, f"empty_{seg_id}.mp4")
+        ext = ".mp4"
         cmd.extend([
             # 黑画面尺寸直接用参考分辨率，帧率用参考帧率
-            "-f", "lavfi", "-i", f"color=c=black:s={ref_width}x{ref_height}:r={ref_fps}",
-            "-f", "lavfi", "-i", f"anullsrc=r={sr}:cl={channel_layout}",
-            "-c:v", "libx264", "-preset", "ultrafast", "-crf", "0",
-            "-c:a", "pcm_s16le", "-ar", str(sr), "-ac", str(channels),
-            "-shortest",
-            output_path
+            "-f", "lavfi", "-i", BLACK_SOURCE_TMPL.format(w=ref_width, h=ref_height, fps=format_frame_rate(ref_fps)),
+            "-f", "lavfi", "-i", SILENCE_SOURCE_TMPL.format(sr=sr, layout=channel_layout),
         ])
+        output_args = (
+            # 与片段转码一致限定每个输出的编码线程数（否则libx264按整机核数开线程，与并发转码抢核）
+            *INTERMEDIATE_THREAD_ARGS,
+            "-c:v", "libx264", *X264_INTERMEDIATE_ARGS,
+            *INTERMEDIATE_AUDIO_ARGS,
+            *INTERMEDIATE_MUX_ARGS,
+        )
     else:
         # 音频空片段逻辑不变
-        output_path = os.path.join(output_dir, f"empty_{seg_id}.wav")
-        cmd.extend([
-            "-f", "lavfi", "-i", f"anullsrc=r={sr}:cl={channel_layout}",
-            "-c:a", "pcm_s16le", "-ar", str(sr), "-ac", str(channels),
-            output_path
-        ])
+        ext = ".wav"
+        cmd.extend(["-f", "lavfi", "-i", SILENCE_SOURCE_TMPL.format(sr=sr, layout=channel_layout)])
+        output_args = INTERMEDIATE_AUDIO_ARGS
+
+    # 每个空片段一个输出（同一输入流可映射到多个输出，源只解码一次）
+    output_paths = []
+    for duration, seg_id in jobs:
+        output_path = os.path.join(output_dir, f"empty_{seg_id}{ext}")
+        cmd.extend(["-t", f"{duration:.4f}", *output_args, output_path])
+        output_paths.append(output_path)
 
     # 执行生成（后续逻辑不变）
-    result = subprocess.run(
-        cmd, capture_output=True, env=env, text=True, encoding="utf-8", stdin=subprocess.DEVNULL
-    )
-    if result.returncode != 0:
-        raise RuntimeError(f"生成空片段失败：{result.stderr}")
-    print(f"✅ 生成空片段（{ref_width}x{ref_height}）：{os.path.basename(output_path)}（时长：{duration:.2f}秒）")
-    return output_path
+    with ENCODE_SLOTS:
+        returncode, err = run_ffmpeg(cmd, env=env)
+    if returncode != 0:
+        raise RuntimeError(f"生成空片段失败：{err}")
+    if verbose:
+        for output_path, (duration, _) in zip(output_paths, jobs):
+            print(f"✅ 生成空片段（{ref_width}x{ref_height}）：{os.path.basename(output_path)}（时长：{duration:.2f}秒）")
+    return output_paths
 
 
 def get_media_duration(file_path: str) -> float:
     """获取媒体时长，失败直接抛错"""
+    file_path = os.path.abspath(file_path)
     try:
-        cmd = [
-            "ffprobe", "-v", "error", "-show_entries", "format=duration",
-            "-of", "default=noprint_wrappers=1:nokey=1", os.path.abspath(file_path)
-        ]
-        result = subprocess.run(
-            cmd, capture_output=True, text=True, encoding="utf-8", stdin=subprocess.DEVNULL
-        )
-        return float(result.stdout.strip())
+        info = _probe_media(file_path, _file_cache_key(file_path))
+        return float(info["format"]["duration"])
     except Exception as e:
         raise RuntimeError(f"获取时长失败（{file_path}）：{str(e)}")
 
 
 # -------------------------- 业务逻辑函数 --------------------------
+@lru_cache(maxsize=None)
+def format_frame_rate(fps: float) -> str:
+    """帧率转为ffmpeg有理数写法（如29.97002997→30000/1001），精确且比长浮点串更短"""
+    rate = Fraction(fps).limit_denominator(1001)
+    return str(rate.numerator) if rate.denominator == 1 else f"{rate.numerator}/{rate.denominator}"
+
+
+@lru_cache(maxsize=None)
+def build_align_filter(ref_width: int, ref_height: int) -> str:
+    """等比例缩放+黑边填充滤镜（同一参考分辨率下所有片段共用，只拼接一次）"""
+    return ALIGN_FILTER_TMPL.format(w=ref_width, h=ref_height)
+
+
+@lru_cache(maxsize=None)
+def build_intermediate_output_args(media_type: str, ref_width: int, ref_height: int, ref_fps: float) -> tuple:
+    """中间片段转码的输出参数（同一次拼接内所有片段相同，只构造一次）"""
+    if media_type == "video":
+        # 核心修改：视频转码用滤镜保持比例，对齐参考分辨率
+        return (
+            *INTERMEDIATE_THREAD_ARGS,
+            "-c:v", "libx264", *X264_INTERMEDIATE_ARGS,
+            "-pix_fmt", "yuv420p",  # 统一像素格式，保证各片段可直接流复制拼接
+            "-vf", build_align_filter(ref_width, ref_height),  # 拼接滤镜
+            "-r", format_frame_rate(ref_fps),
+            *INTERMEDIATE_AUDIO_ARGS,
+            *INTERMEDIATE_MUX_ARGS,
+        )
+    # 音频转码逻辑不变
+    return (*INTERMEDIATE_THREAD_ARGS, *INTERMEDIATE_AUDIO_ARGS, "-vn")
+
+
 def transcode_to_intermediate(
     seg_path: str, 
     media_type: str, 
@@ -857,237 +1030,339 @@ def transcode_to_intermediate(
     seg_idx: int,
     ref_width: int,  
     ref_height: int, 
-    ref_fps: float   
+    ref_fps: float,
+    verbose: bool = True
 ) -> str:
     """转码时对齐参考分辨率，保持原始画面比例（等比例缩放+黑边填充）"""
-    env = os.environ.copy()
-    env["LC_ALL"] = "en_US.UTF-8"
+    env = FFMPEG_ENV
     seg_name = os.path.splitext(os.path.basename(seg_path))[0]
     mid_ext = ".mp4" if media_type == "video" else ".wav"
+
+    # 音频片段已是中间格式（pcm_s16le/44100Hz/立体声WAV）时直接复用，跳过转码
+    # （片段是本流程刚提取的文件，直接读WAV头判断，不再逐个调用ffprobe）
+    if media_type == "audio":
+        wav_params = read_wav_params(seg_path)
+        if (
+            wav_params
+            and wav_params.sampwidth == 2  # WAV为小端，16位整型即pcm_s16le
+            and wav_params.framerate == 44100
+            and wav_params.nchannels == 2
+        ):
+            if verbose:
+                print(f"✅ 片段 {seg_idx+1} 已是中间格式，跳过转码：{os.path.basename(seg_path)}")
+            return seg_path
     temp_path = os.path.join(output_dir, f"temp_seg_{seg_idx}_{seg_name}{mid_ext}")
 
-    transcode_cmd = ["ffmpeg", "-y", "-hide_banner", "-i", seg_path]
-    if media_type == "video":
-        # 核心修改：视频转码用滤镜保持比例，对齐参考分辨率 
-        scale_filter = f"scale=w=min({ref_width}\\,iw*sar):h=min({ref_height}\\,ih)"  # 转义逗号
-        pad_filter = f"pad={ref_width}:{ref_height}:(ow-iw)/2:(oh-ih)/2:black"
-        transcode_cmd.extend([
-            "-c:v", "libx264", "-preset", "ultrafast", "-crf", "0",
-            "-vf", f"{scale_filter},{pad_filter}",  # 拼接滤镜
-            "-r", f"{ref_fps}",
-            "-c:a", "pcm_s16le", "-ar", "44100", "-ac", "2", "-channel_layout", "stereo"
-        ])
-    else:
-        # 音频转码逻辑不变
-        transcode_cmd.extend([
-            "-c:a", "pcm_s16le", "-ar", "44100", "-ac", "2", "-channel_layout", "stereo", "-vn"
-        ])
-    transcode_cmd.append(temp_path)
+    # 只有输入和输出路径随片段变化，其余参数按参考格式缓存复用
+    transcode_cmd = [
+        *TRANSCODE_INPUT_ARGS, seg_path,
+        *build_intermediate_output_args(media_type, ref_width, ref_height, ref_fps),
+        temp_path,
+    ]
 
     # 执行转码（后续逻辑不变）
-    result = subprocess.run(
-        transcode_cmd, capture_output=True, env=env, text=True, encoding="utf-8", stdin=subprocess.DEVNULL
-    )
-    if result.returncode != 0:
-        raise RuntimeError(f"片段 {seg_idx+1} 转码失败：{result.stderr}")
-    print(f"✅ 片段 {seg_idx+1} 转码完成（对齐至 {ref_width}x{ref_height}）：{os.path.basename(temp_path)}")
+    with ENCODE_SLOTS:
+        returncode, err = run_ffmpeg(transcode_cmd, env=env)
+    if returncode != 0:
+        raise RuntimeError(f"片段 {seg_idx+1} 转码失败：{err}")
+    if verbose:
+        print(f"✅ 片段 {seg_idx+1} 转码完成（对齐至 {ref_width}x{ref_height}）：{os.path.basename(temp_path)}")
     return temp_path
 
  
+def get_intermediate_dir(fallback_dir: str, estimated_bytes: int) -> str:
+    """
+    为本次拼接新建私有中间目录：内存盘存在且剩余空间足够（预估2倍余量）时建在内存盘，否则建在fallback_dir下
+    （mkdtemp原子创建唯一目录，同一输出目录下的并发拼接不会互相覆盖或误删中间文件）
+    """
+    if os.path.isdir(RAM_DISK_DIR):
+        try:
+            if shutil.disk_usage(RAM_DISK_DIR).free > estimated_bytes * 2:
+                return tempfile.mkdtemp(prefix="stitch_", dir=RAM_DISK_DIR)
+        except OSError:
+            pass
+    return tempfile.mkdtemp(prefix="stitch_", dir=fallback_dir)
+
+
 # -------------------------- 核心拼接函数（完整修改版） --------------------------
 def stitch_segments_with_empty_timeline(
     media_list_sorted: List[List],  # [[路径, 开始时间, 结束时间, 时长], ...]
     model_input_path: str,  # 原媒体文件（用于获取总时长和兜底格式）
     output_path: str,
-    fill_empty: bool = True
+    fill_empty: bool = True,
+    encode_threads: int = 0,  # 最终编码线程数（0=自动用满全部核心；并发拼接时由调用方按并发数分配）
+    log=print  # 日志输出函数（工作线程内调用时传入缓存函数，由调用方在主线程统一打印，避免多线程日志交错）
 ) -> str:
     """核心拼接函数：优先稳定性，统一中间格式，简化流程"""
     temp_files = []  # 记录所有临时文件（转码片段+空片段+拼接列表）
+    work_dir = None  # 本次拼接的私有中间目录（内存盘或输出目录下）
     try:
         # 1. 初始化配置
         output_path = os.path.abspath(output_path)
         output_dir = os.path.dirname(output_path)
         os.makedirs(output_dir, exist_ok=True)
         output_name = os.path.splitext(os.path.basename(output_path))[0]
-        original_duration = get_media_duration(model_input_path)  # 原媒体总时长
-        media_type = get_media_type(model_input_path)  # 整体媒体类型（视频/音频）
-        print(f"\n📌 媒体类型：{media_type}，原时长：{original_duration:.2f}秒")
-
-        # 2. 过滤无效片段
-        valid_media = []
-        for idx, (seg_path, s, e, seg_duration) in enumerate(media_list_sorted):
-            seg_path = os.path.abspath(seg_path)
-            if not os.path.exists(seg_path) or os.path.getsize(seg_path) < 1024 or s >= e or seg_duration <= 0:
-                print(f"⚠️  片段 {idx+1} 无效（路径：{seg_path}），已跳过")
-                continue
-            valid_media.append([seg_path, s, e, seg_duration])
-        if not valid_media:
-            raise RuntimeError("无有效片段可拼接")
-        print(f"📌 有效片段：{len(valid_media)}个，总时长：{sum(item[3] for item in valid_media):.2f}秒")
-
-
+        # 源文件探测放到后台，与片段过滤重叠执行
+        # （类型与时长共用同一次探测缓存，后台结果就绪后get_media_type直接命中；同一源文件多次拼接时只探测一次）
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as probe_executor:
+            source_future = probe_executor.submit(get_media_duration, model_input_path)
+
+            # 2. 过滤无效片段
+            valid_media = []
+            for idx, (seg_path, s, e, seg_duration) in enumerate(media_list_sorted):
+                seg_path = os.path.abspath(seg_path)
+                if not os.path.exists(seg_path) or os.path.getsize(seg_path) < 1024 or s >= e or seg_duration <= 0:
+                    log(f"⚠️  片段 {idx+1} 无效（路径：{seg_path}），已跳过")
+                    continue
+                valid_media.append([seg_path, s, e, seg_duration])
+            if not valid_media:
+                raise RuntimeError("无有效片段可拼接")
+
+            original_duration = source_future.result()  # 原媒体总时长
+            media_type = get_media_type(model_input_path)  # 整体媒体类型（视频/音频）
         # 新增：解析第一个有效片段的原始分辨率（作为参考标准）
-        first_seg_path = valid_media[0][0]
-        first_seg_info = get_media_info(first_seg_path)
-        ref_width = first_seg_info["width"]
-        ref_height = first_seg_info["height"]
-        ref_fps = first_seg_info["fps"] or 25  # 参考帧率（默认25）
+        # 参考分辨率/帧率只用于视频，纯音频拼接不再为它单独跑一次ffprobe
+        first_seg_info = get_media_info(valid_media[0][0]) if media_type == "video" else {}
+
+        # 3. 片段时间轴转为SoA（开始/结束/时长数组），空白计算和时长统计直接向量化（一次构建，后续日志与规划共用）
+        seg_starts = np.array([item[1] for item in valid_media], dtype=np.float64)
+        seg_ends = np.array([item[2] for item in valid_media], dtype=np.float64)
+        total_seg_duration = float(np.sum([item[3] for item in valid_media]))
+        mid_gaps = seg_starts[1:] - seg_ends[:-1]  # mid_gaps[i-1]：第i-1与第i个片段之间的空白
+        log(f"\n📌 媒体类型：{media_type}，原时长：{original_duration:.2f}秒")
+        log(f"📌 有效片段：{len(valid_media)}个，总时长：{total_seg_duration:.2f}秒")
+
+        ref_width = first_seg_info.get("width")
+        ref_height = first_seg_info.get("height")
+        ref_fps = first_seg_info.get("fps") or 25  # 参考帧率（默认25）
         if not ref_width or not ref_height:
             # 极端情况：第一个片段无分辨率信息，用默认值
             ref_width, ref_height = 1280, 720
-        print(f"📌 参考分辨率：{ref_width}x{ref_height}，参考帧率：{ref_fps:.2f}fps")
-
-        # 3. 转码所有有效片段为中间格式（确保格式统一）
-        transcoded_media = []
-        for idx, (seg_path, s, e, seg_duration) in enumerate(valid_media):
-            # 转码（无论原格式如何，统一为中间格式）
-            try:
-                transcoded_path = transcode_to_intermediate(
-                    seg_path, media_type, output_dir, idx,
-                    ref_width=ref_width, ref_height=ref_height, ref_fps=ref_fps
-                )
-                transcoded_media.append([transcoded_path, s, e, seg_duration])
-                temp_files.append(transcoded_path)
-            except Exception as e:
-                raise RuntimeError(f"片段 {idx+1} 处理失败：{str(e)}")
-        valid_media = transcoded_media
+        log(f"📌 参考分辨率：{ref_width}x{ref_height}，参考帧率：{ref_fps:.2f}fps")
 
-        # 4. 生成最终片段列表（有效片段+空片段）
+        # 预估中间文件体积（PCM音频 + 无损H.264约为原始YUV的1/3），决定是否放到内存盘
+        bytes_per_sec = 44100 * 2 * 2
+        if media_type == "video":
+            bytes_per_sec += int(ref_width * ref_height * 1.5 * ref_fps / 3)
+        work_dir = get_intermediate_dir(output_dir, int(original_duration * bytes_per_sec))
+        log(f"📌 中间文件目录：{work_dir}")
+
+        # 4. 规划最终片段列表（有效片段+空片段）：先用占位符排好顺序，转码/生成完成后统一替换为路径
         final_segments = []
+        empty_jobs = {}  # 时长 → (时长, 片段ID)（同时长的空白复用同一文件，concat列表可重复引用）
+
+        def get_empty_segment(duration, seg_id):
+            key = f"{duration:.4f}"  # 与generate_empty_media_segments的-t精度一致
+            if key not in empty_jobs:
+                empty_jobs[key] = (duration, seg_id)
+            return ("empty", key)
+
         if fill_empty:
-            print("\n🔧 填充空白部分...")
+            log("\n🔧 填充空白部分...")
             # 4.1 开头空片段
-            first_start = valid_media[0][1]
+            first_start = float(seg_starts[0])
             if first_start > 0.01:
-                empty_path = generate_empty_media_segment(
-                    media_type, first_start, output_dir, "start",
-                    ref_width=ref_width, ref_height=ref_height, ref_fps=ref_fps
-                )
-                final_segments.append(empty_path)
-                temp_files.append(empty_path)
-
-            # 4.2 中间空片段
-            for i in range(1, len(valid_media)):
-                prev_end = valid_media[i-1][2]
-                curr_start = valid_media[i][1]
-                gap = curr_start - prev_end
-                if gap > 0.01:
-                    # 添加前一个有效片段 + 中间空片段
-                    final_segments.append(valid_media[i-1][0])
-                    empty_path = generate_empty_media_segment(media_type, gap, output_dir, f"mid_{i}",ref_width=ref_width, ref_height=ref_height, ref_fps=ref_fps)
-                    final_segments.append(empty_path)
-                    temp_files.append(empty_path)
-                else:
-                    # 间隙过小，直接添加前一个有效片段
-                    final_segments.append(valid_media[i-1][0])
+                final_segments.append(get_empty_segment(first_start, "start"))
+
+            # 4.2 中间空片段（间隙过小时不补空白）
+            # 掩码一次算出需要补空白的位置，只在这些位置插入空片段，其余有效片段按区间整段追加
+            gap_mask = mid_gaps > 0.01
+            gap_values = mid_gaps.tolist()
+            next_idx = 0
+            for j in np.flatnonzero(gap_mask).tolist():  # 空白位于第j与第j+1个有效片段之间
+                final_segments.extend(("seg", idx) for idx in range(next_idx, j + 1))
+                final_segments.append(get_empty_segment(gap_values[j], f"mid_{j+1}"))
+                next_idx = j + 1
+            final_segments.extend(("seg", idx) for idx in range(next_idx, len(valid_media)))
 
             # 4.3 结尾空片段
-            last_end = valid_media[-1][2]
             # 计算已填充的总时长（有效片段+已加空片段）
-            filled_duration = first_start + sum(item[3] for item in valid_media)
-            filled_duration += sum(valid_media[i][1] - valid_media[i-1][2] for i in range(1, len(valid_media)) if valid_media[i][1] - valid_media[i-1][2] > 0.01)
+            filled_duration = first_start + total_seg_duration + float(mid_gaps[gap_mask].sum())
             end_gap = original_duration - filled_duration
             if end_gap > 0.01:
-                final_segments.append(valid_media[-1][0])
-                empty_path = generate_empty_media_segment(media_type, end_gap, output_dir, "end",ref_width=ref_width, ref_height=ref_height, ref_fps=ref_fps)
-                final_segments.append(empty_path)
-                temp_files.append(empty_path)
-            else:
-                final_segments.append(valid_media[-1][0])
+                final_segments.append(get_empty_segment(end_gap, "end"))
         else:
             # 不填充空白，直接拼接有效片段
-            final_segments = [item[0] for item in valid_media]
-            print("\n🔧 不填充空白，仅拼接有效片段")
-
-        # 5. 生成拼接列表文件
-        concat_list_path = os.path.join(output_dir, f"{output_name}_concat.txt")
-        with open(concat_list_path, "w", encoding="utf-8") as f:
-            for path in final_segments:
-                f.write(f"file '{os.path.abspath(path)}'\n")
-        temp_files.append(concat_list_path)
-        print(f"\n📌 拼接列表生成完成（{len(final_segments)}个片段）")
-
-        # 6. 拼接中间格式片段（直接复制流，最快且稳定）
-        mid_output_path = os.path.join(output_dir, f"{output_name}_mid.mp4" if media_type == "video" else f"{output_name}_mid.wav")
-        concat_cmd = [
-            "ffmpeg", "-y", "-hide_banner",
-            "-f", "concat", "-safe", "0", "-i", concat_list_path,
-            "-c:v", "copy" if media_type == "video" else "-vn",  # 视频复制流，音频忽略视频
-            "-c:a", "copy",  # 音频复制流
-            "-shortest",  # 确保时长匹配
-            mid_output_path
-        ]
-        print(f"🚀 开始拼接中间格式片段...")
-        env = os.environ.copy()
-        env["LC_ALL"] = "en_US.UTF-8"
-        result = subprocess.run(
-            concat_cmd, capture_output=True, env=env, text=True, encoding="utf-8", stdin=subprocess.DEVNULL
-        )
-        if result.returncode != 0:
-            raise RuntimeError(f"拼接失败：{result.stderr}")
-        temp_files.append(mid_output_path)  # 中间文件后续会清理
+            final_segments = [("seg", idx) for idx in range(len(valid_media))]
+            log("\n🔧 不填充空白，仅拼接有效片段")
 
-        # 7. 转码为最终输出格式（根据用户输入的output_path后缀）
+        # 5. 确定最终输出格式（根据用户输入的output_path后缀）
         final_ext = os.path.splitext(output_path)[1].lower()
-        # 定义格式→编码器映射（确保兼容性）
-        format_encoder = {
-            "video": {
-                ".mp4": ("libx264", ["-preset", "ultrafast", "-crf", "23"]),
-                ".avi": ("mpeg4", ["-qscale:v", "2"]),
-                ".mov": ("libx264", ["-preset", "ultrafast", "-crf", "23"]),
-                ".mkv": ("libx264", ["-preset", "ultrafast", "-crf", "23"])
-            },
-            "audio": {
-                ".wav": ("copy", []),
-                ".mp3": ("libmp3lame", ["-b:a", "192k"]),
-                ".flac": ("flac", []),
-                ".aac": ("aac", ["-b:a", "128k"])
-            }
-        }
+        format_encoder = FINAL_FORMAT_ENCODERS[media_type]
         # 校验最终格式，无效则用默认
-        valid_exts = list(format_encoder[media_type].keys())
-        if final_ext not in valid_exts:
+        if final_ext not in format_encoder:
             final_ext = ".mp4" if media_type == "video" else ".mp3"
             output_path = os.path.join(output_dir, f"{output_name}{final_ext}")
-            print(f"⚠️  输出格式无效，自动使用默认：{final_ext}")
-
-        # 执行最终转码
-        enc, enc_params = format_encoder[media_type][final_ext]
-        transcode_cmd = [
-            "ffmpeg", "-y", "-hide_banner", "-i", mid_output_path,
-            "-c:v", enc if media_type == "video" else "-vn",
-            "-c:a", enc if media_type == "audio" else "aac",
-            *enc_params,
-            output_path
+            log(f"⚠️  输出格式无效，自动使用默认：{final_ext}")
+
+        enc, enc_params = format_encoder[final_ext]
+        # 纯音频、无空白片段且最终需要重新编码时：片段均为原文件流复制截取（编码参数一致），
+        # concat解复用器直接读原片段，由最终编码一次完成解码+重采样+编码，省去逐片段转码为中间WAV的一轮
+        direct_concat = media_type == "audio" and not empty_jobs and enc != "copy"
+        # 原文件音频编码与目标格式相同（如MP3源输出MP3）时连解码/编码都省去：原片段直接流复制拼接
+        # 流复制不会重采样/改声道：仅当原文件已是中间格式的采样率和声道数时才流复制，
+        # 保证输出格式与是否填充空白无关（否则单声道源不填充时输出单声道，填充时输出立体声）
+        stream_copy = False
+        if direct_concat and enc in STREAM_COPY_SOURCE_CODECS:
+            source_info = get_media_info(model_input_path)
+            stream_copy = (
+                source_info["audio_codec"] == STREAM_COPY_SOURCE_CODECS[enc]
+                and source_info["sr"] == INTERMEDIATE_SAMPLE_RATE
+                and source_info["channels"] == INTERMEDIATE_CHANNELS
+            )
+        if stream_copy:
+            enc, enc_params = "copy", ()
+
+        # 6. 片段转码（统一中间格式，后续直接流复制拼接）与空片段批量生成提交到同一线程池：
+        #    线程数多于编码槽位，探测等准备工作可与编码重叠，同时运行的编码ffmpeg由ENCODE_SLOTS限流
+        keys = list(empty_jobs)
+        key_groups = [
+            keys[i : i + MAX_OUTPUTS_PER_PROCESS]
+            for i in range(0, len(keys), MAX_OUTPUTS_PER_PROCESS)
         ]
-        print(f"🔄 转码为最终格式：{final_ext}...")
-        result = subprocess.run(
-            transcode_cmd, capture_output=True, env=env, text=True, encoding="utf-8", stdin=subprocess.DEVNULL
-        )
-        if result.returncode != 0:
-            raise RuntimeError(f"最终转码失败：{result.stderr}")
-
-        # 8. 结果校验
-        final_duration = get_media_duration(output_path)
-        target_duration = original_duration if fill_empty else sum(item[3] for item in valid_media)
-        print(f"\n✅ 拼接完成！")
-        print(f"  - 输出文件：{output_path}")
-        print(f"  - 最终时长：{final_duration:.2f}秒（目标：{target_duration:.2f}秒）")
+        resolved = {}  # 占位符 → 实际文件路径
+        if direct_concat:
+            resolved.update((("seg", idx), item[0]) for idx, item in enumerate(valid_media))
+        else:
+            with concurrent.futures.ThreadPoolExecutor(
+                max_workers=INTERMEDIATE_WORKERS * 2
+            ) as executor:
+                future_map = {}  # 关联：Future对象 → 片段索引
+                for idx, (seg_path, s, e, seg_duration) in enumerate(valid_media):
+                    future = executor.submit(
+                        transcode_to_intermediate,
+                        seg_path, media_type, work_dir, idx,
+                        ref_width=ref_width, ref_height=ref_height, ref_fps=ref_fps,
+                        verbose=False  # 工作线程内不逐个打印，结束后统一汇总
+                    )
+                    future_map[future] = idx
+                # 空片段：每组一个ffmpeg进程，多组并发
+                empty_futures = [
+                    (group, executor.submit(
+                        generate_empty_media_segments,
+                        media_type, [empty_jobs[k] for k in group], work_dir,
+                        ref_width=ref_width, ref_height=ref_height, ref_fps=ref_fps,
+                        verbose=False
+                    ))
+                    for group in key_groups
+                ]
+                for future in concurrent.futures.as_completed(future_map):
+                    idx = future_map[future]
+                    seg_path = valid_media[idx][0]
+                    try:
+                        transcoded_path = future.result()
+                    except Exception as e:
+                        raise RuntimeError(f"片段 {idx+1} 处理失败：{str(e)}")
+                    resolved[("seg", idx)] = transcoded_path
+                    if transcoded_path != seg_path:  # 直接复用的原片段不是临时文件，不能清理
+                        temp_files.append(transcoded_path)
+                for group, future in empty_futures:
+                    paths = future.result()
+                    temp_files.extend(paths)
+                    resolved.update((("empty", k), path) for k, path in zip(group, paths))
+        final_segments = [resolved[item] for item in final_segments]
+        if direct_concat:
+            log(f"✅ 片段无需转码：{len(valid_media)}个原片段直接拼接并{'流复制' if stream_copy else '编码'}")
+        else:
+            reused = sum(1 for idx, item in enumerate(valid_media) if resolved[("seg", idx)] == item[0])
+            log(f"✅ 片段转码完成：{len(valid_media)}个（直接复用{reused}个），生成空片段：{len(empty_jobs)}个（{ref_width}x{ref_height}）")
+
+        # 先写到同目录的临时文件，成功后os.replace原子替换：覆盖已有结果时，失败也不会留下半截文件
+        partial_path = os.path.join(output_dir, f"{output_name}.partial{final_ext}")
+        temp_files.append(partial_path)
+        target_duration = original_duration if fill_empty else total_seg_duration
+        if (
+            media_type == "audio"
+            and enc == "copy"
+            and len(final_segments) == 1
+            and os.path.splitext(final_segments[0])[1].lower() == final_ext
+        ):
+            # 只有一个片段且无需编码（同格式流复制）：拼接结果就是该文件本身，直接复制，不再启动ffmpeg
+            log(f"\n📌 仅1个片段且格式一致，直接复制为最终文件：{final_ext}")
+            shutil.copyfile(final_segments[0], partial_path)
+        else:
+            # 7. 生成拼接列表文件
+            concat_list_path = os.path.join(work_dir, f"{output_name}_concat.txt")
+            # 片段路径均已是绝对路径，整份列表在内存中拼好后一次写入
+            concat_list = "".join(
+                CONCAT_LINE_TMPL.format(path) for path in final_segments
+            )
+            with open(concat_list_path, "wb") as f:
+                f.write(concat_list.encode("utf-8"))
+            temp_files.append(concat_list_path)
+            log(f"\n📌 拼接列表生成完成（{len(final_segments)}个片段）")
+
+            # 8. 拼接与最终转码合并为一次ffmpeg：concat解复用器直接喂给最终编码器，
+            #    省去中间整文件的一次写出和读回（WAV输出时仍是纯流复制）
+            if media_type == "video":
+                codec_args = ["-c:v", enc, "-c:a", "aac", "-shortest"]
+            else:
+                codec_args = ["-vn", "-c:a", enc]
+                if direct_concat and not stream_copy:
+                    # 原片段未经中间转码，输出采样率/声道/采样位深与中间格式保持一致
+                    codec_args.extend(INTERMEDIATE_AUDIO_FORMAT_ARGS)
+                    codec_args.extend(INTERMEDIATE_SAMPLE_FMT_ARGS)
+            concat_cmd = [
+                *FFMPEG_CMD_PREFIX,
+                "-f", "concat", "-safe", "0", "-i", concat_list_path,
+                "-threads", str(encode_threads),  # 最终转码为单进程，默认交给编码器使用全部核心
+                *codec_args,
+                *enc_params,
+                partial_path
+            ]
+            log(f"🚀 拼接并转码为最终格式：{final_ext}...")
+            last_reported = 0
+
+            def report_progress(out_sec):
+                # 最终编码耗时最长：按10%步进打印（不输出PROGRESS行，避免与调用方的整体进度混淆）
+                nonlocal last_reported
+                if target_duration <= 0:
+                    return
+                pct = min(100, int(out_sec * 100 / target_duration)) // 10 * 10
+                if pct > last_reported:
+                    last_reported = pct
+                    log(f"  - 拼接进度：{pct}%")
+
+            env = FFMPEG_ENV
+            # 最终编码同样占用编码槽位：多个说话人并发拼接时，同时运行的编码ffmpeg总数仍受ENCODE_SLOTS限制
+            with ENCODE_SLOTS:
+                returncode, err = run_ffmpeg(concat_cmd, env=env, on_progress=report_progress)
+            if returncode != 0:
+                raise RuntimeError(f"拼接失败：{err}")
+        os.replace(partial_path, output_path)
+
+        # 9. 结果校验
+        # WAV/MP4输出直接读头部，其他格式用ffprobe
+        wav_params = read_wav_params(output_path)
+        if wav_params:
+            final_duration = wav_params.nframes / wav_params.framerate
+        else:
+            final_duration = read_mp4_duration(output_path) or get_media_duration(output_path)
+        log(f"\n✅ 拼接完成！")
+        log(f"  - 输出文件：{output_path}")
+        log(f"  - 最终时长：{final_duration:.2f}秒（目标：{target_duration:.2f}秒）")
         return output_path
 
     finally:
         # 清理所有临时文件
-        print("\n🔧 清理临时文件...")
+        log("\n🔧 清理临时文件...")
+        # 私有中间目录整体删除，目录内的文件不再逐个删除
+        removed = 0
         for p in temp_files:
+            if work_dir and os.path.dirname(p) == work_dir:
+                continue
             if os.path.exists(p):
                 try:
                     os.remove(p)
-                    print(f"✅ 清理：{os.path.basename(p)}")
+                    removed += 1
                 except PermissionError:
-                    print(f"⚠️  无法删除（被占用）：{os.path.basename(p)}")
-        # 终止残留FFmpeg进程（Windows）
-        if os.name == "nt":
-            try:
-                subprocess.run(["taskkill", "/f", "/im", "ffmpeg.exe"], capture_output=True, stdin=subprocess.DEVNULL)
-            except:
-                pass
\ No newline at end of file
+                    log(f"⚠️  无法删除（被占用）：{os.path.basename(p)}")
+        if removed:
+            log(f"✅ 已清理临时文件：{removed}个")
+        if work_dir:
+            # 放到后台线程删除，结果已写出后不再阻塞调用方（非守护线程：进程退出前仍会删完，不残留中间文件）
+            threading.Thread(
+                target=shutil.rmtree, args=(work_dir,), kwargs={"ignore_errors": True}
+            ).start()
+            log(f"✅ 后台清理中间目录：{work_dir}")
+        # 所有ffmpeg子进程均已等待结束，无需再按进程名强杀（并发拼接时会误杀其他说话人的ffmpeg）